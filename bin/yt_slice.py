@@ -1,11 +1,15 @@
 #!/Users/pan/anaconda/envs/python3/bin/python
 import os, sys
-import yt
+import glob
+import copy
 import numpy as np
 import string
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 from optparse import OptionParser
+from multiprocessing import Pool
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','scripts'))
+from utility.timer import timer
 """
 This version only supports data in 1D spherical, 2D cylindrical or 3D cartesian coordinates
 
@@ -26,6 +30,7 @@ def readCommand(argv):
     USAGE: ./yt_slice.py -n <file name> <options>
 
     EXAMPLE: ./yt_slice.py -n ccsn2d_hdf5_plt_cnt_0200 -v entr --rmax=3e7
+    BATCH:   ./yt_slice.py -b -n "ccsn2d_hdf5_plt_cnt_*" -v dens,entr -p 8 -o frames
 
     """
     parser = OptionParser(usageStr)
@@ -37,6 +42,23 @@ def readCommand(argv):
             help=default('Max radius to plot'),default=4e7)
     parser.add_option('-l','--log',dest="log",
             help=default('In log scale'),default="None")
+    parser.add_option('-f','--fast',dest="fast",action="store_true",
+            help=default('Read the data with h5py directly, without yt'),default=False)
+    parser.add_option('--max-level',dest="max_level",
+            help=default('Preview: only use the AMR levels up to this (yt) level'),default='')
+    parser.add_option('--out',dest="out",
+            help=default('Save the image to this file instead of showing it'),default='')
+    parser.add_option('--export',dest="export",
+            help=default('Also save the 2D/3D slice images into this column store directory'),default='')
+    parser.add_option('--trace',dest="trace",
+            help=default('Save the stage timings to this json/csv file'),default='')
+    parser.add_option('-b','--batch',dest="batch",action="store_true",
+            help=default('Save png files of all files matching the glob pattern <file name> and '
+                         'all comma separated variables, without showing them'),default=False)
+    parser.add_option('-o','--outdir',dest="outdir",
+            help=default('Output directory in batch mode'),default='.')
+    parser.add_option('-p','--nprocs',dest="nprocs",
+            help=default('Number of processes in batch mode'),default=1)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -47,80 +69,285 @@ def readCommand(argv):
 def draw_slice():
 
     options = readCommand(sys.argv[1:])
-    fn = options.fname
-    ds = yt.load(fn)
-
-    # find the dimension of the data
-    dim_raw = ds.domain_dimensions
-    dim_x = dim_raw[0]
-    dim_y = dim_raw[1]
-    dim_z = dim_raw[2]
-    dim   = 0
-    if dim_z == 1:
-        if dim_y == 1:
-            dim = 1
-        else:
-            dim = 2
+    if options.batch:
+        draw_batch(options)
     else:
-        dim = 3
-    
-    if dim ==1:
-        draw_1d(ds,options)
+        fout = None
+        if options.out != '':
+            fout = options.out
+        data, dim = load_data(options.fname,options)
+        image = None
+        if options.export != '' and dim > 1:
+            images = get_images(data,dim,[options.var],options)
+            export_images(options.fname,data,images,options)
+            image  = images[options.var]
+        draw_data(data,dim,options,fout,image)
+
+    if options.trace != '':
+        timer.save(options.trace)
+    print("Done.")
+    return
+
+def load_data(fn,options):
+    """
+    load a file with yt, or with FlashReader in the fast mode
+
+    return: the data and its dimension
+    """
+    if options.fast:
+        import flash_reader
+        with timer.stage("load",fn=fn):
+            fr = flash_reader.FlashReader(fn)
+        return fr, fr.dim
+
+    with timer.stage("import"):
+        import add_fields as af
+        from dataset_cache import datasets
+    ds = datasets.get(fn)
+    return ds, af.get_dimension(ds)
+
+def draw_data(data,dim,options,fout=None,image=None):
+    """
+    draw one variable of the data
+
+    fout:  output image file name, None to show the figure
+    image: the pixelized slice of a 2D/3D data (optional)
+    """
+    if options.fast:
+        if dim ==1:
+            draw_1d_fast(data,options,fout)
+        elif dim ==2:
+            draw_2d_fast(data,options,fout,image)
+        else:
+            draw_3d_fast(data,options,fout,image)
+    elif dim ==1:
+        draw_1d(data,options,fout)
     elif dim ==2:
-        draw_2d(ds,options)
+        draw_2d(data,options,fout,image)
     elif dim==3:
-        draw_3d(ds,options)
+        draw_3d(data,options,fout,image)
     else:
         print("Dimension error. ", dim)
         quit()
+    return
 
-    print("Done.")
+def show_or_save(fout):
+    """
+    show the current figure, or save it to fout and close it
+    """
+    if fout is None:
+        plt.show()
+        return
+    # write to a temporary file first, so an interrupted run leaves no broken frames
+    tmp = fout+".tmp"
+    # the format of fout, not of the temporary file
+    fmt = os.path.splitext(fout)[1][1:].lower() or 'png'
+    with timer.stage("save",fout=fout):
+        plt.savefig(tmp,format=fmt)
+    plt.close('all')
+    os.rename(tmp,fout)
     return
 
-def draw_1d(ds,options):
+def get_preview(options):
+    """
+    return the Preview of the options, None if not a preview
+    """
+    if options.max_level == '':
+        return None
+    from preview import Preview
+    return Preview(max_level=int(options.max_level))
+
+def get_max_level(options):
+    if options.max_level == '':
+        return None
+    return int(options.max_level)
+
+def get_images(data,dim,fields,options):
+    """
+    pixelize the fields of a 2D/3D slice together
+
+    return: dict of images [npix, npix] with extent [-rmax,rmax,-rmax,rmax]
+    """
+    rmax = float(options.rmax)
+    if options.fast:
+        images = {}
+        for var in fields:
+            with timer.stage("pixelize",var=var):
+                images[var] = data.pixelize(var,(-rmax,rmax),(-rmax,rmax),(1024,1024),
+                                            max_level=get_max_level(options))
+        return images
+    import slice2d
+    preview = get_preview(options)
+    if dim == 2:
+        return slice2d.get_slice_images(data,fields,rmax,preview=preview)
+    return slice2d.get_slice_images(data,fields,rmax,axis='z',coord=0.0,preview=preview)
+
+def export_images(fn,data,images,options,save_index=True):
+    """
+    save the slice images into the column store options.export
+
+    return: the index entries of the images
+    """
+    from column_store import ColumnStore
+    store = ColumnStore(options.export)
+    rmax  = float(options.rmax)
+    if options.fast:
+        time = float(data.time)
+    else:
+        time = float(data.current_time.in_cgs().v)
+    entries = {}
+    for var in images:
+        name = os.path.basename(fn)+'_'+var.strip()
+        entries[name] = store.write_image(name,images[var],save_index=False,
+                var=var,fn=os.path.abspath(fn),time=time,
+                extent=[-rmax,rmax,-rmax,rmax])
+    if save_index:
+        store.add_images(entries)
+    return entries
+
+def get_frame_name(fn,var,outdir):
+    return os.path.join(outdir,os.path.basename(fn)+'_'+var.strip()+'.png')
+
+def draw_frames(fn,variables,options):
+    """
+    draw all variables of one file into png files.
+    The file is loaded once, and existing frames are skipped.
+
+    return: the index entries of the exported images 
+            (added to the store by the caller)
+    """
+    entries  = {}
+    todo = []
+    for var in variables:
+        fout = get_frame_name(fn,var,options.outdir)
+        if not os.path.exists(fout):
+            todo.append((var,fout))
+    if len(todo) == 0:
+        return entries
+
+    try:
+        data, dim = load_data(fn,options)
+        # pixelize all variables of a 2D/3D slice together
+        images = {}
+        if dim > 1 and (not options.fast or options.export != ''):
+            images = get_images(data,dim,[var for var, fout in todo],options)
+        if options.export != '':
+            entries = export_images(fn,data,images,options,save_index=False)
+        for var, fout in todo:
+            opts = copy.copy(options)
+            opts.var = var
+            draw_data(data,dim,opts,fout,images.get(var))
+            print("Saved",fout)
+    except Exception as e:
+        print("Error: failed to draw",fn,e)
+    return entries
+
+def _draw_frames(args):
+    # send the timings of this file only, with the derived field timings
+    timer.take()
+    entries = draw_frames(*args)
+    return timer.take(), entries
+
+def draw_batch(options):
+    """
+    draw all files matching the glob pattern in options.fname
+    with a pool of options.nprocs processes
+    """
+    plt.switch_backend('Agg')
+    files = sorted(glob.glob(options.fname))
+    if len(files) == 0:
+        print("Error: no files found.",options.fname)
+        quit()
+    if not os.path.isdir(options.outdir):
+        os.makedirs(options.outdir)
+
+    variables = options.var.split(',')
+    args = [(fn,variables,options) for fn in files]
+    nprocs = int(options.nprocs)
+    entries = {}
+    if nprocs > 1:
+        pool = Pool(nprocs)
+        # collect the timings and the exported images of the workers
+        for (records, fields), images in pool.map(_draw_frames,args,chunksize=1):
+            timer.merge(records,fields)
+            entries.update(images)
+        pool.close()
+        pool.join()
+    else:
+        for arg in args:
+            entries.update(draw_frames(*arg))
+    if options.export != '' and len(entries) > 0:
+        from column_store import ColumnStore
+        ColumnStore(options.export).add_images(entries)
+    return
+
+def draw_1d(ds,options,fout=None):
+
+    rmax = float(options.rmax)
+    var  = options.var
+    log  = options.log
+
+    with timer.stage("ray",var=var):
+        ray = ds.ray([0,0,0],[rmax,0,0])
+        r   = ray['t']*rmax
+        values = ray[var]
+    plt.figure()
+    plt.plot(r,values,'-')
+    plt.xlabel("Radius [cm]")
+    plt.ylabel(var)
+    if log != "None":
+        plt.yscale('log')
+    show_or_save(fout)
+
+    return
+def draw_1d_fast(fr,options,fout=None):
 
     rmax = float(options.rmax)
     var  = options.var
     log  = options.log
 
-    ray = ds.ray([0,0,0],[rmax,0,0])
+    with timer.stage("read",var=var):
+        cells = fr.get_cells([var])
+    s1 = cells["x"].argsort()
+    r  = cells["x"][s1]
+    use = r <= rmax
     plt.figure()
-    plt.plot(ray['t']*rmax,ray[var],'-')
+    plt.plot(r[use],cells[var][s1][use],'-')
     plt.xlabel("Radius [cm]")
     plt.ylabel(var)
     if log != "None":
         plt.yscale('log')
-    plt.show()
+    show_or_save(fout)
 
     return
-def draw_2d(ds,options):
+def draw_2d(ds,options,fout=None,image=None):
+    import slice2d
 
     rmax = float(options.rmax)
     var  = options.var
     log  = options.log
     clim = "auto"
     
-    pc = yt.SlicePlot(ds,"theta",var,origin=('center','left', 'window'))
-    slc_frb = pc.data_source.to_frb((2*rmax,"cm"),1024,
-            center=(0,0),height=(2*rmax,"cm"))
+    if image is None:
+        image = slice2d.get_slice_images(ds,[var],rmax,preview=get_preview(options))[var]
     plt.figure(1,figsize=(6,8))
     if var=="deps":
         my_map = "seismic"
     else:
         my_map = "Spectral_r"
     if log=="None":
-        plt.imshow(slc_frb[var].d,extent=[-rmax,rmax,-rmax,rmax],
+        plt.imshow(image,extent=[-rmax,rmax,-rmax,rmax],
                     interpolation='nearest',
                     aspect=1.0,
                     cmap=my_map,
-                    origin='center')
+                    origin='lower')
     else:
-        plt.imshow(slc_frb[var].d,extent=[-rmax,rmax,-rmax,rmax],
+        plt.imshow(image,extent=[-rmax,rmax,-rmax,rmax],
                     interpolation='nearest',
                     aspect=1.0,
                     cmap=my_map,
                     norm=mpl.colors.LogNorm(),
-                    origin='center')
+                    origin='lower')
     cbar = plt.colorbar(shrink=0.96)
     cbar.ax.set_ylabel(var,rotation=270,labelpad=15)
     if clim != "auto":
@@ -130,38 +357,120 @@ def draw_2d(ds,options):
     plt.xlim(0,rmax)
     plt.ylim(-rmax,rmax)
     plt.tight_layout()
-    plt.show()
+    show_or_save(fout)
 
     return
-def draw_3d(ds,options):
+def draw_2d_fast(fr,options,fout=None,image=None):
 
     rmax = float(options.rmax)
     var  = options.var
     log  = options.log
-    clim = "auto"
-    fout = "slice.png"
 
-    ds.periodicity = (True, True, True)
-    slice = yt.SlicePlot(ds,'z',[var],
-            center=[0,0,0],
-            width=(rmax,'cm'))
+    if image is None:
+        with timer.stage("pixelize",var=var):
+            image = fr.pixelize(var,(-rmax,rmax),(-rmax,rmax),(1024,1024),
+                                max_level=get_max_level(options))
+    plt.figure(1,figsize=(6,8))
+    if var=="deps":
+        my_map = "seismic"
+    else:
+        my_map = "Spectral_r"
+    if log=="None":
+        plt.imshow(image,extent=[-rmax,rmax,-rmax,rmax],
+                    interpolation='nearest',
+                    aspect=1.0,
+                    cmap=my_map,
+                    origin='lower')
+    else:
+        plt.imshow(image,extent=[-rmax,rmax,-rmax,rmax],
+                    interpolation='nearest',
+                    aspect=1.0,
+                    cmap=my_map,
+                    norm=mpl.colors.LogNorm(),
+                    origin='lower')
+    cbar = plt.colorbar(shrink=0.96)
+    cbar.ax.set_ylabel(var,rotation=270,labelpad=15)
+    plt.xlabel("R [cm]")
+    plt.ylabel("Z [cm]")
+    plt.xlim(0,rmax)
+    plt.ylim(-rmax,rmax)
+    plt.tight_layout()
+    show_or_save(fout)
+
+    return
+def draw_3d(ds,options,fout=None,image=None):
+    import slice2d
 
-    if log!="None":
-        slice.set_log(var,True)
+    rmax = float(options.rmax)
+    var  = options.var
+    log  = options.log
+    clim = "auto"
+
+    # pixelize the z=0 slice in memory
+    preview = get_preview(options)
+    if image is None:
+        image = slice2d.get_slice_images(ds,[var],rmax,axis='z',coord=0.0,preview=preview)[var]
+    if preview is not None:
+        preview.report(ds,rmax)
+    plt.figure(1,figsize=(7,6))
+    if log=="None":
+        plt.imshow(image,extent=[-rmax,rmax,-rmax,rmax],
+                    interpolation='nearest',
+                    aspect=1.0,
+                    cmap="Spectral_r",
+                    origin='lower')
     else:
-        slice.set_log(var,False)
+        plt.imshow(image,extent=[-rmax,rmax,-rmax,rmax],
+                    interpolation='nearest',
+                    aspect=1.0,
+                    cmap="Spectral_r",
+                    norm=mpl.colors.LogNorm(),
+                    origin='lower')
+    cbar = plt.colorbar(shrink=0.96)
+    cbar.ax.set_ylabel(var,rotation=270,labelpad=15)
     if clim != "auto":
-        slice.set_zlim(var,cmin,cmax)
-    slice.set_cmap('entr',cmap="Spectral_r")
-    slice.set_width((2.*rmax,2.*rmax))
-    slice.save(fout)
-    
-    # open the image
-    image = plt.imread(fout)
-    fig, ax = plt.subplots()
-    ax.imshow(image)
-    ax.axis('off')
-    plt.show()
+        plt.clim([cmin,cmax])
+    plt.xlabel("X [cm]")
+    plt.ylabel("Y [cm]")
+    plt.xlim(-rmax,rmax)
+    plt.ylim(-rmax,rmax)
+    plt.tight_layout()
+    show_or_save(fout)
+
+    return
+def draw_3d_fast(fr,options,fout=None,image=None):
+
+    rmax = float(options.rmax)
+    var  = options.var
+    log  = options.log
+
+    # only the blocks on the z=0 plane within rmax are read
+    if image is None:
+        with timer.stage("pixelize",var=var):
+            image = fr.pixelize(var,(-rmax,rmax),(-rmax,rmax),(1024,1024),z=0.0,
+                                max_level=get_max_level(options))
+    plt.figure(1,figsize=(7,6))
+    if log=="None":
+        plt.imshow(image,extent=[-rmax,rmax,-rmax,rmax],
+                    interpolation='nearest',
+                    aspect=1.0,
+                    cmap="Spectral_r",
+                    origin='lower')
+    else:
+        plt.imshow(image,extent=[-rmax,rmax,-rmax,rmax],
+                    interpolation='nearest',
+                    aspect=1.0,
+                    cmap="Spectral_r",
+                    norm=mpl.colors.LogNorm(),
+                    origin='lower')
+    cbar = plt.colorbar(shrink=0.96)
+    cbar.ax.set_ylabel(var,rotation=270,labelpad=15)
+    plt.xlabel("X [cm]")
+    plt.ylabel("Y [cm]")
+    plt.xlim(-rmax,rmax)
+    plt.ylim(-rmax,rmax)
+    plt.tight_layout()
+    show_or_save(fout)
 
     return
 
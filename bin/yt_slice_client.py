@@ -0,0 +1,156 @@
+#!/Users/pan/anaconda/envs/python3/bin/python
+import os, sys
+import json
+import socket
+import tempfile
+from optparse import OptionParser
+"""
+A thin client of yt_slice_server.py.
+
+It sends a slice request over a Unix socket to a running server,
+which keeps the datasets loaded, and saves the returned png or
+the raw array (.npy). It never imports yt, so it starts quickly.
+
+ex.
+    ./yt_slice_server.py &
+    ./yt_slice_client.py -n ccsn2d_hdf5_plt_cnt_0200 -v entr --out entr.png
+    ./yt_slice_client.py -n ccsn2d_hdf5_plt_cnt_0200 -v entr --out entr.npy
+
+"""
+
+def get_socket_name():
+    """
+    the default socket of the current user
+    """
+    user = os.environ.get("USER","user")
+    return os.path.join(tempfile.gettempdir(),"yt_slice_"+user+".sock")
+
+def send_message(sock,header,payload=b""):
+    """
+    send a json header line followed by a binary payload
+    """
+    header = dict(header)
+    header["nbytes"] = len(payload)
+    sock.sendall(json.dumps(header).encode('utf-8')+b"\n"+payload)
+    return
+
+def recv_message(sock):
+    """
+    receive a json header line and its binary payload
+
+    return: header dict, payload bytes
+    """
+    f = sock.makefile('rb')
+    line = f.readline()
+    if not line:
+        raise IOError("Connection closed without a reply")
+    header  = json.loads(line.decode('utf-8'))
+    payload = f.read(header.get("nbytes",0))
+    f.close()
+    return header, payload
+
+def request(header,sock_name=None):
+    """
+    send one request to the server and wait for the reply
+
+    return: header dict, payload bytes
+    """
+    if sock_name is None:
+        sock_name = get_socket_name()
+    sock = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    try:
+        sock.connect(sock_name)
+        send_message(sock,header)
+        return recv_message(sock)
+    finally:
+        sock.close()
+
+def default(str):
+    return str + ' [Default: %default]'
+def readCommand(argv):
+    usageStr = """
+
+    USAGE: ./yt_slice_client.py -n <file name> <options>
+
+    EXAMPLE: ./yt_slice_client.py -n ccsn2d_hdf5_plt_cnt_0200 -v entr --rmax=3e7 --out entr.png
+    STATUS:  ./yt_slice_client.py --status
+    STOP:    ./yt_slice_client.py --stop
+
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-n','--fname',dest="fname",
+            help=default('File name'),default='')
+    parser.add_option('-v','--var',dest="var",
+            help=default('Plot variable.'),default='dens')
+    parser.add_option('-r','--rmax',dest="rmax",
+            help=default('Max radius to plot'),default=4e7)
+    parser.add_option('-l','--log',dest="log",
+            help=default('In log scale'),default="None")
+    parser.add_option('-f','--fast',dest="fast",action="store_true",
+            help=default('Read 1D/2D data with h5py directly, without yt'),default=False)
+    parser.add_option('--out',dest="out",
+            help=default('Save the png, or the raw array if it ends with .npy, '
+                         'to this file instead of showing it'),default='')
+    parser.add_option('-s','--socket',dest="socket",
+            help=default('The socket of the server'),default=get_socket_name())
+    parser.add_option('--status',dest="status",action="store_true",
+            help=default('Print the datasets loaded in the server'),default=False)
+    parser.add_option('--stop',dest="stop",action="store_true",
+            help=default('Stop the server'),default=False)
+
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understand: '+str(otherjunk))
+
+    return options
+
+def main():
+
+    options = readCommand(sys.argv[1:])
+    if options.status:
+        header = {"cmd":"status"}
+    elif options.stop:
+        header = {"cmd":"stop"}
+    else:
+        kind = "png"
+        if options.out.endswith(".npy"):
+            kind = "array"
+        header = {"cmd":"slice","kind":kind,
+                  "fname":os.path.abspath(options.fname),
+                  "var":options.var,
+                  "rmax":str(options.rmax),
+                  "log":options.log,
+                  "fast":options.fast}
+
+    try:
+        reply, payload = request(header,options.socket)
+    except (IOError,OSError) as e:
+        print("Error: no server at",options.socket,"("+str(e)+").",
+              "Start one with yt_slice_server.py")
+        sys.exit(1)
+    if reply["status"] != "ok":
+        print("Error:",reply.get("message"))
+        sys.exit(1)
+
+    if header["cmd"] == "status":
+        for fn in reply["files"]:
+            print(fn)
+    elif header["cmd"] == "slice":
+        if options.out != '':
+            with open(options.out,'wb') as f:
+                f.write(payload)
+            print("Saved",options.out)
+        else:
+            import io
+            import matplotlib.pyplot as plt
+            import matplotlib.image as mpimg
+            image = mpimg.imread(io.BytesIO(payload),format='png')
+            plt.figure()
+            plt.imshow(image)
+            plt.axis('off')
+            plt.show()
+    return
+
+if __name__=='__main__':
+
+    main()
@@ -0,0 +1,181 @@
+#!/Users/pan/anaconda/envs/python3/bin/python
+import os, sys
+import io
+import shutil
+import tempfile
+import socketserver
+from collections import OrderedDict
+from optparse import OptionParser
+import numpy as np
+import matplotlib.pyplot as plt
+import yt_slice
+from yt_slice_client import get_socket_name, send_message, recv_message
+from utility.timer import timer
+from dataset_cache import datasets
+"""
+A long-lived server that keeps the last loaded datasets (and their
+indices) in memory, so repeated slices from yt_slice_client.py skip
+the python startup, the yt import and the index construction.
+
+The requests are served one by one, since yt is not thread safe.
+
+ex.
+    ./yt_slice_server.py -c 4 &
+    ./yt_slice_client.py -n ccsn2d_hdf5_plt_cnt_0200 -v entr --out entr.png
+
+"""
+
+class DatasetLRU():
+    """
+    keep the last capacity loaded files, the least recently used
+    one is dropped first. The yt datasets are kept by the shared
+    dataset cache, only the FlashReaders of the fast mode are kept here.
+    """
+    def __init__(self,capacity=4):
+        self.capacity = capacity
+        self.data = OrderedDict()
+        datasets.capacity = capacity
+        return
+
+    def get(self,fn,options):
+        """
+        return the data and its dimension, load it if not in memory
+        """
+        if not options.fast:
+            return yt_slice.load_data(fn,options)
+        if fn in self.data:
+            self.data.move_to_end(fn)
+            return self.data[fn]
+        self.data[fn] = yt_slice.load_data(fn,options)
+        while len(self.data) > self.capacity:
+            old, (data, dim) = self.data.popitem(last=False)
+            data.close()
+        return self.data[fn]
+
+    def files(self):
+        return datasets.files() + list(self.data.keys())
+
+def get_array(data,dim,options):
+    """
+    return the raw data of a slice request:
+    [2, n] radius and values in 1D, the pixelized [npix, npix] image in 2D/3D
+    """
+    rmax = float(options.rmax)
+    var  = options.var
+    if dim > 1:
+        return yt_slice.get_images(data,dim,[var],options)[var]
+    if options.fast:
+        cells = data.get_cells([var])
+        s1 = cells["x"].argsort()
+        return np.array([cells["x"][s1],cells[var][s1]])
+    ray = data.ray([0,0,0],[rmax,0,0])
+    s1  = ray['t'].argsort()
+    return np.array([ray['t'].d[s1]*rmax,ray[var].d[s1]])
+
+class SliceHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        header, payload = recv_message(self.request)
+        server = self.server
+        timer.reset()
+        try:
+            cmd = header.get("cmd")
+            if cmd == "status":
+                send_message(self.request,{"status":"ok","files":server.datasets.files()})
+            elif cmd == "stop":
+                send_message(self.request,{"status":"ok"})
+                server.stop = True
+            elif cmd == "slice":
+                payload = self.get_slice(header)
+                send_message(self.request,{"status":"ok","trace":timer.get_trace()},payload)
+            else:
+                send_message(self.request,{"status":"error","message":"unknown command "+str(cmd)})
+        except Exception as e:
+            plt.close('all')
+            send_message(self.request,{"status":"error","message":str(e)})
+        finally:
+            # the timings were sent with the reply
+            timer.reset()
+        return
+
+    def get_slice(self,header):
+        """
+        return the png or the .npy bytes of a slice request
+        """
+        argv = ["-n",header["fname"],"-v",header["var"],
+                "-r",header["rmax"],"-l",header["log"]]
+        if header.get("fast"):
+            argv.append("-f")
+        options = yt_slice.readCommand(argv)
+        data, dim = self.server.datasets.get(options.fname,options)
+
+        if header.get("kind") == "array":
+            buf = io.BytesIO()
+            np.save(buf,get_array(data,dim,options))
+            return buf.getvalue()
+
+        fout = os.path.join(self.server.tmpdir,"slice.png")
+        yt_slice.draw_data(data,dim,options,fout)
+        with open(fout,'rb') as f:
+            payload = f.read()
+        os.remove(fout)
+        return payload
+
+class SliceServer(socketserver.UnixStreamServer):
+    """
+    serve slice requests on a Unix socket
+
+    sock_name [str]: the socket file
+    capacity  [int]: number of datasets kept in memory
+    """
+    def __init__(self,sock_name,capacity=4):
+        if os.path.exists(sock_name):
+            os.remove(sock_name)
+        socketserver.UnixStreamServer.__init__(self,sock_name,SliceHandler)
+        self.sock_name = sock_name
+        self.datasets  = DatasetLRU(capacity)
+        self.tmpdir    = tempfile.mkdtemp()
+        self.stop      = False
+        return
+
+    def serve(self):
+        try:
+            while not self.stop:
+                self.handle_request()
+        finally:
+            self.server_close()
+            os.remove(self.sock_name)
+            shutil.rmtree(self.tmpdir)
+        return
+
+def default(str):
+    return str + ' [Default: %default]'
+def readCommand(argv):
+    usageStr = """
+
+    USAGE: ./yt_slice_server.py <options>
+
+    EXAMPLE: ./yt_slice_server.py -c 4 &
+
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-s','--socket',dest="socket",
+            help=default('The socket file'),default=get_socket_name())
+    parser.add_option('-c','--capacity',dest="capacity",
+            help=default('Number of datasets kept in memory'),default=4)
+
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understand: '+str(otherjunk))
+
+    return options
+
+if __name__=='__main__':
+
+    options = readCommand(sys.argv[1:])
+    plt.switch_backend('Agg')
+    import yt
+    server = SliceServer(options.socket,int(options.capacity))
+    print("Serving on",options.socket)
+    server.serve()
+    print("Done.")
@@ -1,20 +1,199 @@
 import yt
-from yt.mods import *
 import numpy as np
 from scipy.interpolate import interp1d
+from yt.units.dimensions import mass, energy, temperature
+from utility.timer import timer
+#
+# the entropy unit of FLASH: kB per baryon, in cgs
+#
+KB_BY = yt.YTQuantity(1.3806488e-16/1.674e-24,'erg/K/g')
+
+#
+# compact evaluation mode
+#
+# The derived fields are computed with in-place ufuncs into float64
+# scratch buffers that are reused by all chunks, and only the result
+# is allocated. This avoids the full-size temporaries of each
+# operation (ex. cos_phi*velx + sin_phi*vely makes three) and the
+# unit conversions, so the peak memory of a field drops from ~3-6 to
+# ~1 array of the chunk.
+#
+# The results can be stored as float32 to halve their memory. They are
+# still computed in float64 and rounded once, so the relative error
+# is < 6e-8 (half a float32 ulp); the profile sums are accumulated in
+# float64 by numpy. The yt pixelization, volume rendering and
+# create_profile routines only take float64 fields, so float32 only
+# works with the numpy code paths (ex. RadialProfile(engine="bincount"),
+# get_chunked_profile, get_multi_profile, AngularProfile).
+#
+# In float64 the results equal the default ones to round-off (~1e-16),
+# except sph_volume, which avoids the cancellation of rout**3-rin**3.
+#
+_compact = {"enabled":False, "dtype":np.dtype(np.float64)}
+_buffers = {}
+
+def set_compact_mode(enabled=True,dtype=np.float64):
+    """
+    evaluate the derived fields in the compact mode (in place, stored as dtype).
+    The fields already stored in data objects are not recomputed.
+
+    ex. set_compact_mode(dtype=np.float32) before RadialProfile(engine="bincount")
+    """
+    _compact["enabled"] = enabled
+    _compact["dtype"]   = np.dtype(dtype)
+    _buffers.clear()
+    clear_geometry_cache()
+    return
+
+def is_compact():
+    return _compact["enabled"]
+
+def get_buffer(name,shape):
+    """
+    return a float64 scratch buffer of shape, reused by all chunks
+    """
+    size = int(np.prod(shape))
+    buf  = _buffers.get(name)
+    if buf is None or buf.size < size:
+        buf = np.empty(size)
+        _buffers[name] = buf
+    return buf[:size].reshape(shape)
+
+def new_field(data,shape,units):
+    """
+    return a new (uninitialized) field array of the compact dtype
+    """
+    return data.ds.arr(np.empty(shape,dtype=_compact["dtype"]),units)
+
+def get_cgs(value):
+    """
+    return the values of a field in cgs units, without a copy if possible
+    """
+    if value.units == value.units.get_cgs_equivalent():
+        return value.d
+    return value.in_cgs().d
+
+#
+# geometry shared by the derived fields of one chunk
+#
+_geometry_cache = {}
+
+def _get_geometry(data,name):
+    """
+    return a geometry quantity of the current chunk
+
+    The geometry is computed once per chunk (grid) and is evicted 
+    as soon as the fields of another chunk are requested.
+
+    name: "sph_radius", "sph_volume", "cyl_radius", "cyl_volume", 
+          "phi", "cos_phi", or "sin_phi"
+    """
+    r = data["r"]
+    if _geometry_cache.get("r") is not r:
+        _geometry_cache.clear()
+        _geometry_cache["r"] = r
+    if name in _geometry_cache:
+        return _geometry_cache[name]
+    if is_compact():
+        value = _get_compact_geometry(data,name,r)
+        _geometry_cache[name] = value
+        return value
+
+    if name == "sph_radius":
+        value = r
+    elif name == "sph_volume":
+        #return 4.0*np.pi*data["dr"]*(data["r"]**2)
+        # rout**3-rin**3 = dr*(3r**2+dr**2/4), without the cancellation at large r
+        dr = data["dr"]
+        value = 4.0/3.0*np.pi*dr*(3.0*r**2+0.25*dr**2)
+    elif name == "cyl_radius":
+        value = np.sqrt(r**2 + data["z"]**2)
+    elif name == "cyl_volume":
+        value = data["dr"]*data["dz"]*2*np.pi*r
+    elif name == "phi":
+        # arctan2 is well defined on the axis (r = 0)
+        value = np.arctan2(data["z"],r)
+    elif name == "cos_phi":
+        value = np.cos(_get_geometry(data,"phi"))
+    elif name == "sin_phi":
+        value = np.sin(_get_geometry(data,"phi"))
+    _geometry_cache[name] = value
+    return value
+
+def _get_compact_geometry(data,name,r):
+    """
+    compute a geometry quantity in the compact mode.
+    The fields (radius and volume) are new arrays of the compact dtype,
+    cos_phi and sin_phi are float64 scratch buffers, valid for this chunk only.
+    """
+    shape = r.shape
+    rv = r.d
+    if name == "sph_radius":
+        value = new_field(data,shape,r.units)
+        value.view(np.ndarray)[...] = rv
+    elif name == "sph_volume":
+        dr  = data["dr"].d
+        tmp = get_buffer("tmp",shape)
+        np.multiply(rv,rv,out=tmp)
+        tmp *= 3.0
+        buf = get_buffer("tmp2",shape)
+        np.multiply(dr,dr,out=buf)
+        buf *= 0.25
+        tmp += buf
+        tmp *= dr
+        value = new_field(data,shape,r.units**3)
+        np.multiply(tmp,4.0/3.0*np.pi,out=value.view(np.ndarray))
+    elif name in ("cyl_radius","cos_phi","sin_phi"):
+        # the distance to the origin, in float64 for cos_phi and sin_phi
+        if "dist" not in _geometry_cache:
+            _geometry_cache["z"] = data["z"].d
+            dist = get_buffer("dist",shape)
+            buf  = get_buffer("tmp",shape)
+            np.multiply(rv,rv,out=dist)
+            np.multiply(_geometry_cache["z"],_geometry_cache["z"],out=buf)
+            dist += buf
+            np.sqrt(dist,out=dist)
+            _geometry_cache["dist"] = dist
+        dist = _geometry_cache["dist"]
+        if name == "cyl_radius":
+            value = new_field(data,shape,r.units)
+            value.view(np.ndarray)[...] = dist
+        else:
+            # cos_phi = r/dist, sin_phi = z/dist
+            value = get_buffer(name,shape)
+            x = rv if name == "cos_phi" else _geometry_cache["z"]
+            with np.errstate(divide='ignore',invalid='ignore'):
+                np.divide(x,dist,out=value)
+            if not dist.all():
+                # the same as the arctan2 at the origin
+                value[dist == 0] = 1.0 if name == "cos_phi" else 0.0
+    elif name == "cyl_volume":
+        tmp = get_buffer("tmp",shape)
+        np.multiply(data["dr"].d,data["dz"].d,out=tmp)
+        tmp *= rv
+        value = new_field(data,shape,r.units**3)
+        np.multiply(tmp,2*np.pi,out=value.view(np.ndarray))
+    return value
+
+def clear_geometry_cache():
+    """
+    release the geometry of the last chunk
+    """
+    _geometry_cache.clear()
+    return
+
 #
 # 1D spherical radius
 #
 def _sph_radius(field,data):
-    return data['r']
+    return _get_geometry(data,"sph_radius")
 
 def _sph_volume(field,data):
-    #return 4.0*np.pi*data["dr"]*(data["r"]**2)
-    rout = data["r"]+0.5*data["dr"]
-    rin  = data["r"]-0.5*data["dr"]
-    return 4.0/3.0*np.pi*(rout**3-rin**3)
+    return _get_geometry(data,"sph_volume")
 
 def _sph_cell_mass(field,data):
+    if is_compact():
+        return _compact_cell_mass(data,"sph_cell_volume")
     return data["dens"]*data["sph_cell_volume"]
 
 def _sph_radial_velocity(field,data):
@@ -27,59 +206,118 @@ def _sph_tangential_velocity(field,data):
 #
 
 def _cyl_radius(field,data):
-    return np.sqrt(data['r']**2 + data['z']**2)
+    return _get_geometry(data,"cyl_radius")
 
 def _cyl_volume(field,data):
-    return data["dr"]*data["dz"]*2*np.pi*data["r"]
+    return _get_geometry(data,"cyl_volume")
 
 def _cyl_cell_mass(field,data):
+    if is_compact():
+        return _compact_cell_mass(data,"cyl_cell_volume")
     return data["dens"]*data["cyl_cell_volume"]
 
+def _compact_cell_mass(data,volume):
+    dens  = data["dens"]
+    vol   = data[volume]
+    value = new_field(data,dens.shape,"g")
+    # computed in float64, rounded once into value
+    np.multiply(get_cgs(dens),get_cgs(vol),out=value.view(np.ndarray))
+    return value
+
 
 def _cyl_radial_velocity(field,data):
-    r = data["r"]
-    z = data["z"]
-    velx = data["velx"]
-    vely = data["vely"]
-    phi = np.arctan(z/r)
-    velr = np.cos(phi)*velx + np.sin(phi)*vely
+    cos_phi = _get_geometry(data,"cos_phi")
+    sin_phi = _get_geometry(data,"sin_phi")
+    if is_compact():
+        return _compact_rotate(data,cos_phi,sin_phi,tangential=False)
+    velr = cos_phi*data["velx"] + sin_phi*data["vely"]
     return velr
 
 def _cyl_tangential_velocity(field,data):
-    r = data["r"]
-    z = data["z"]
-    velx = data["velx"]
-    vely = data["vely"]
-    phi = np.arctan(z/r)
-    tanr = -np.sin(phi)*velx + np.cos(phi)*vely
+    cos_phi = _get_geometry(data,"cos_phi")
+    sin_phi = _get_geometry(data,"sin_phi")
+    if is_compact():
+        return _compact_rotate(data,cos_phi,sin_phi,tangential=True)
+    tanr = -sin_phi*data["velx"] + cos_phi*data["vely"]
     return tanr
 
+def _compact_rotate(data,cos_phi,sin_phi,tangential=False):
+    """
+    return the radial (cos_phi*velx + sin_phi*vely) or the
+    tangential (cos_phi*vely - sin_phi*velx) velocity in cm/s
+    """
+    velx = get_cgs(data["velx"])
+    vely = get_cgs(data["vely"])
+    tmp  = get_buffer("tmp",velx.shape)
+    buf  = get_buffer("tmp2",velx.shape)
+    value = new_field(data,velx.shape,"cm/s")
+    if tangential:
+        np.multiply(cos_phi,vely,out=tmp)
+        np.multiply(sin_phi,velx,out=buf)
+        np.subtract(tmp,buf,out=value.view(np.ndarray))
+    else:
+        np.multiply(cos_phi,velx,out=tmp)
+        np.multiply(sin_phi,vely,out=buf)
+        np.add(tmp,buf,out=value.view(np.ndarray))
+    return value
+
 
 # no need for 3D cartesian
 
+#
+# entropy in kB/by
+#
+def _entr(field,data):
+    """
+    fixed the entropy units in flash
+    """
+    entr = data["entr"]
+    if is_compact():
+        # entr is already in kB/by, no conversion needed
+        value = new_field(data,entr.shape,"kB/by")
+        value.view(np.ndarray)[...] = entr.d
+        return value
+    return entr*KB_BY
+
 
 def add_sph_fields(ds):
     """
     add yt fields for 1D spherical coordinates
     """
-    ds.add_field("radial_velocity",function=_sph_radial_velocity,units='cm/s')
-    ds.add_field("tangential_velocity",function=_sph_tangential_velocity,units='cm/s')
-    ds.add_field("radius",function=_sph_radius,units='cm')
-    ds.add_field("sph_radius",function=_sph_radius,units='cm')
-    ds.add_field('sph_cell_volume',function=_sph_volume,units='cm**3')
-    ds.add_field('sph_cell_mass',function=_sph_cell_mass,units='g')
+    ds.add_field(("gas","radial_velocity"),function=timer.field(_sph_radial_velocity),sampling_type="cell",units='cm/s',force_override=True)
+    ds.add_field(("gas","tangential_velocity"),function=timer.field(_sph_tangential_velocity),sampling_type="cell",units='cm/s',force_override=True)
+    ds.add_field(("gas","radius"),function=timer.field(_sph_radius),sampling_type="cell",units='cm',force_override=True)
+    ds.add_field(("gas","sph_radius"),function=timer.field(_sph_radius),sampling_type="cell",units='cm')
+    ds.add_field(("gas","sph_cell_volume"),function=timer.field(_sph_volume),sampling_type="cell",units='cm**3')
+    ds.add_field(("gas","sph_cell_mass"),function=timer.field(_sph_cell_mass),sampling_type="cell",units='g')
     return ds
 
 def add_cyl_fields(ds):
     """
     add yt fields for 2D cylindrical coordinates
     """
-    ds.add_field("radial_velocity",function=_cyl_radial_velocity,units='cm/s')
-    ds.add_field("tangential_velocity",function=_cyl_tangential_velocity,units='cm/s')
-    ds.add_field("radius",function=_cyl_radius,units='cm')
-    ds.add_field("cyl_radius",function=_cyl_radius,units='cm')
-    ds.add_field('cyl_cell_volume',function=_cyl_volume,units='cm**3')
-    ds.add_field('cyl_cell_mass',function=_cyl_cell_mass,units='g')
+    ds.add_field(("gas","radial_velocity"),function=timer.field(_cyl_radial_velocity),sampling_type="cell",units='cm/s',force_override=True)
+    ds.add_field(("gas","tangential_velocity"),function=timer.field(_cyl_tangential_velocity),sampling_type="cell",units='cm/s',force_override=True)
+    ds.add_field(("gas","radius"),function=timer.field(_cyl_radius),sampling_type="cell",units='cm',force_override=True)
+    ds.add_field(("gas","cyl_radius"),function=timer.field(_cyl_radius),sampling_type="cell",units='cm')
+    ds.add_field(("gas","cyl_cell_volume"),function=timer.field(_cyl_volume),sampling_type="cell",units='cm**3')
+    ds.add_field(("gas","cyl_cell_mass"),function=timer.field(_cyl_cell_mass),sampling_type="cell",units='g')
+    return ds
+
+def add_entropy_fields(ds):
+    """
+    register the kB and by (baryon) units, and the Entr field in kB/by
+    if the data has the entropy
+    """
+    # the base values are in the base units of the registry (cgs in yt 3, mks in yt 4)
+    ds.unit_registry.add('kB',1.3806488e-16*ds.quan(1,'erg/K').units.base_value,
+                         dimensions=energy/temperature,tex_repr='k_{B}')
+    ds.unit_registry.add('by',1.674e-24*ds.quan(1,'g').units.base_value,
+                         dimensions=mass,tex_repr='baryon')
+    if "entr" in [name for ftype, name in ds.field_list]:
+        ds.add_field(("gas","Entr"),function=timer.field(_entr),sampling_type="cell",units="kB/by",
+                display_name="Entropy",
+                dimensions=energy/temperature/mass)
     return ds
 
 def add_car_fields(ds):
@@ -88,6 +326,17 @@ def add_car_fields(ds):
     """
     return ds
 
+def get_dimension(ds):
+    """
+    find the dimension of the data from the domain dimensions
+    """
+    dim_raw = ds.domain_dimensions
+    if dim_raw[2] == 1:
+        if dim_raw[1] == 1:
+            return 1
+        return 2
+    return 3
+
 def add_ccsn_fields(ds,dim):
     if dim==1:
         ds = add_sph_fields(ds)
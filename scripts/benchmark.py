@@ -0,0 +1,292 @@
+import os, sys
+import time
+import json
+import types
+import shutil
+import tempfile
+import platform
+import importlib.util
+import numpy as np
+import yt
+import matplotlib as mpl
+mpl.use('Agg')
+import matplotlib.pyplot as plt
+from optparse import OptionParser
+from get_profiles import RadialProfile
+from slice2d import slice2d
+from dataset_cache import setup_dataset, add_default_fields
+import add_fields as af
+"""
+Benchmarks of the analysis scripts on synthetic FLASH-like datasets.
+
+The datasets are created in memory (1D spherical, 2D cylindrical and
+3D Cartesian AMR), so no data files are needed.
+The timings are written to a JSON file, to compare versions.
+
+ex.
+    python benchmark.py -o bench.json --label=v0.3
+    python benchmark.py -o bench_compact.json --label=v0.3-compact --compact
+
+"""
+
+# the derived fields evaluated by the derived_fields benchmark
+DERIVED_FIELDS = {1:["radial_velocity","sph_cell_volume","sph_cell_mass","Entr"],
+                  2:["radial_velocity","tangential_velocity","cyl_radius",
+                     "cyl_cell_volume","cyl_cell_mass","Entr"],
+                  3:["Entr"]}
+
+# the grid sizes of each dimension
+SIZES = {"small":  {1:1000,  2:128, 3:32},
+         "medium": {1:10000, 2:512, 3:64}}
+
+RMAX = 5.e7
+
+def _flash_like_fields(x,y,z,r):
+    """
+    CCSN-like profiles as a function of the spherical radius r
+    """
+    dens = 1.e10*np.exp(-r/1.e7)
+    entr = 3.0+5.0*np.tanh(r/2.e7)
+    ye   = 0.5-0.1*np.exp(-r/5.e6)
+    velx = -1.e9*x/(r+1.e6)
+    vely = -1.e9*y/(r+1.e6)
+    return {"dens":(dens,"g/cm**3"),
+            "entr":(entr,""),
+            "ye  ":(ye,""),
+            "velx":(velx,"cm/s"),
+            "vely":(vely,"cm/s"),
+            "velz":(-1.e9*z/(r+1.e6),"cm/s")}
+
+def create_1d_dataset(n):
+    """
+    a 1D spherical dataset with n cells within RMAX
+    """
+    r = (np.arange(n)+0.5)*RMAX/n
+    fields = _flash_like_fields(r,0.0*r,0.0*r,r)
+    data = {}
+    for var in fields:
+        data[var] = (fields[var][0].reshape(n,1,1),fields[var][1])
+    bbox = np.array([[0.0,RMAX],[0.0,np.pi],[0.0,2.0*np.pi]])
+    return yt.load_uniform_grid(data,(n,1,1),bbox=bbox,
+            geometry="spherical",length_unit="cm")
+
+def create_2d_dataset(n):
+    """
+    a 2D cylindrical (r,z) dataset with n x 2n cells
+    """
+    x = (np.arange(n)+0.5)*RMAX/n
+    z = (np.arange(2*n)+0.5)*RMAX/n - RMAX
+    X, Z = np.meshgrid(x,z,indexing='ij')
+    fields = _flash_like_fields(X,Z,0.0*X,np.sqrt(X**2+Z**2))
+    data = {}
+    for var in fields:
+        data[var] = (fields[var][0].reshape(n,2*n,1),fields[var][1])
+    bbox = np.array([[0.0,RMAX],[-RMAX,RMAX],[0.0,2.0*np.pi]])
+    return yt.load_uniform_grid(data,(n,2*n,1),bbox=bbox,
+            geometry="cylindrical",length_unit="cm")
+
+def create_3d_dataset(n):
+    """
+    a 3D Cartesian AMR dataset: a n^3 base grid and
+    a n^3 level 1 grid covering the central half of the domain
+    """
+    grids = []
+    for level, (le, re) in enumerate([(-RMAX,RMAX),(-RMAX/2,RMAX/2)]):
+        x = le + (np.arange(n)+0.5)*(re-le)/n
+        X, Y, Z = np.meshgrid(x,x,x,indexing='ij')
+        fields = _flash_like_fields(X,Y,Z,np.sqrt(X**2+Y**2+Z**2))
+        grid = {"left_edge":[le]*3, "right_edge":[re]*3,
+                "level":level, "dimensions":[n,n,n]}
+        for var in fields:
+            grid[var] = fields[var]
+        grids.append(grid)
+    bbox = np.array([[-RMAX,RMAX]]*3)
+    ds = yt.load_amr_grids(grids,[n,n,n],bbox=bbox,length_unit="cm")
+
+    # FLASH data has cell_mass from the density alias
+    def _cell_mass(field,data):
+        return data["dens"]*data["cell_volume"]
+    ds.add_field(("gas","cell_mass"),function=_cell_mass,sampling_type="cell",units="g")
+    return ds
+
+def create_dataset(dim,n):
+    if dim==1:
+        return create_1d_dataset(n)
+    elif dim==2:
+        return create_2d_dataset(n)
+    return create_3d_dataset(n)
+
+def get_ncells(ds):
+    return int(ds.index.grid_dimensions.prod(axis=1).sum())
+
+def timeit(func,repeats=3):
+    """
+    return the best and mean wall time of func() in seconds
+    """
+    times = []
+    for i in range(repeats):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter()-t0)
+        plt.close('all')
+    return min(times), float(np.mean(times))
+
+def load_yt_slice():
+    """
+    import bin/yt_slice.py as a module
+    """
+    fn = os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','bin','yt_slice.py')
+    spec = importlib.util.spec_from_file_location("yt_slice",fn)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def load_volume_rendering():
+    """
+    import volume_rendering with a small render setting if
+    my_volume_rendering_setting is not available
+    """
+    try:
+        import my_volume_rendering_setting
+    except ImportError:
+        setting = types.ModuleType("my_volume_rendering_setting")
+        setting.PNS_DENSITY   = 1.e11
+        setting.PNS_ENTR      = 0.5
+        setting.TSHIFT        = 0.0
+        setting.CUSTOM_EMAX   = False
+        setting.VR_RESOLUTION = 128
+        setting.VR_WIDTH      = 2.*RMAX
+        setting.DO_ROT        = False
+        setting.ROT_FRAMES    = 1
+        setting.DO_ZOOM       = False
+        setting.ZOOM_FACT     = 1.0
+        setting.ZOOM_FRAMES   = 1
+        setting.get_emin_emax = lambda time: (3.0,8.0)
+        setting.get_shock_entropy = lambda time, emin, emax: (0.5*(emin+emax), 0.5)
+        sys.modules["my_volume_rendering_setting"] = setting
+    import volume_rendering
+    return volume_rendering
+
+def eval_derived_fields(ds,dim):
+    """
+    evaluate the derived fields of dim on a new data object
+    """
+    ad = ds.all_data()
+    for field in DERIVED_FIELDS[dim]:
+        ad[field]
+    af.clear_geometry_cache()
+    return ad
+
+def run_benchmarks(sizes=("small",),repeats=3,do_vr=True,compact=False):
+    """
+    run all benchmarks
+
+    compact [bool]: evaluate the derived fields in the compact (in place) mode
+
+    return: a list of results {"name", "dim", "size", "ncells", "best", "mean"}
+    """
+    variables = ["dens","entr","ye  "]
+    ys = load_yt_slice()
+    options = ys.readCommand(["-v","dens","-r",str(RMAX)])
+    results = []
+    af.set_compact_mode(compact)
+
+    def add(name,dim,size,ds,func):
+        best, mean = timeit(func,repeats)
+        ncells = get_ncells(ds)
+        results.append({"name":name,"dim":dim,"size":size,"ncells":ncells,
+                        "best":best,"mean":mean,"repeats":repeats})
+        print("%-20s %dD %-8s %10.4f s" % (name,dim,size,best))
+        return
+
+    for size in sizes:
+        for dim in (1,2,3):
+            n  = SIZES[size][dim]
+            t0 = time.perf_counter()
+            ds = create_dataset(dim,n)
+            ds = setup_dataset(ds,[add_default_fields])
+            ds.index
+            dt = time.perf_counter()-t0
+            results.append({"name":"create_dataset","dim":dim,"size":size,
+                            "ncells":get_ncells(ds),"best":dt,"mean":dt,"repeats":1})
+
+            add("derived_fields",dim,size,ds,lambda: eval_derived_fields(ds,dim))
+
+            rp = RadialProfile(dr=RMAX/500,rmax=RMAX)
+            add("get_profile",dim,size,ds,lambda: rp.get_profile(ds,dim,variables))
+            if dim > 1:
+                rpb = RadialProfile(dr=RMAX/500,rmax=RMAX,engine="bincount")
+                add("get_profile_bincount",dim,size,ds,lambda: rpb.get_profile(ds,dim,variables))
+
+            fout = os.path.join(os.getcwd(),"bench_slice.png")
+            if dim==1:
+                add("yt_slice.draw_1d",dim,size,ds,lambda: ys.draw_1d(ds,options,fout))
+            elif dim==2:
+                add("slice2d",dim,size,ds,lambda: slice2d(ds,"dens",RMAX))
+                add("yt_slice.draw_2d",dim,size,ds,lambda: ys.draw_2d(ds,options,fout))
+            else:
+                add("yt_slice.draw_3d",dim,size,ds,lambda: ys.draw_3d(ds,options,fout))
+                if do_vr:
+                    vr = load_volume_rendering()
+                    add("plot_a_vr",dim,size,ds,
+                        lambda: vr.plot_a_vr(".","bench3d",0,use_ghost_zones=False,
+                                             annotate=False,rotate=False,zoom=False,ds=ds))
+    return results
+
+def default(str):
+    return str + ' [Default: %default]'
+def readCommand(argv):
+    usageStr = """
+
+    USAGE: python benchmark.py <options>
+
+    EXAMPLE: python benchmark.py -s small,medium -o bench.json --label=v0.3
+
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-s','--sizes',dest="sizes",
+            help=default('Comma separated dataset sizes ('+','.join(SIZES.keys())+')'),default='small')
+    parser.add_option('-r','--repeats',dest="repeats",
+            help=default('Number of repeats of each benchmark'),default=3)
+    parser.add_option('-o','--output',dest="output",
+            help=default('Output JSON file'),default='bench.json')
+    parser.add_option('--label',dest="label",
+            help=default('A label of this run, ex. the version'),default='')
+    parser.add_option('--no-vr',dest="vr",action="store_false",
+            help=default('Skip the volume rendering benchmark'),default=True)
+    parser.add_option('--compact',dest="compact",action="store_true",
+            help=default('Evaluate the derived fields in the compact (in place) mode'),default=False)
+
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understand: '+str(otherjunk))
+
+    return options
+
+if __name__=='__main__':
+
+    options = readCommand(sys.argv[1:])
+    fout = os.path.abspath(options.output)
+
+    # all figures are written into a temporary directory
+    cwd = os.getcwd()
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    try:
+        results = run_benchmarks(options.sizes.split(','),
+                repeats=int(options.repeats),do_vr=options.vr,compact=options.compact)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir)
+
+    output = {"label":options.label,
+              "time":time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python":platform.python_version(),
+              "yt":yt.__version__,
+              "numpy":np.__version__,
+              "machine":platform.node(),
+              "compact":options.compact,
+              "results":results}
+    with open(fout,'w') as f:
+        json.dump(output,f,indent=1)
+    print("Saved",fout)
@@ -0,0 +1,233 @@
+import os
+import io
+import json
+import numpy as np
+"""
+A columnar, memory-mappable store of radial profiles and slice images.
+
+Each column is a .npy file, described by a small JSON index:
+
+    <path>/index.json
+    <path>/radius.npy            [nbins]
+    <path>/time.npy              [ntime]
+    <path>/profiles/<var>.npy    [ntime, nbins], one file per variable
+    <path>/images/<name>.npy     [ny, nx]
+
+The columns are opened with np.load(mmap_mode='r'), so reading one
+variable of a long time series does not read the other variables,
+and only the touched rows are read from disk.
+
+ex.
+    store = ColumnStore("profiles.store")
+    store.append_profile(fn,time,rp.radius,rp.profiles)
+    ...
+    store = ColumnStore("profiles.store")
+    entr  = store.get_profiles("entr")       # memmap [ntime, nbins]
+    image = store.get_image("ccsn2d_hdf5_plt_cnt_0200_entr")
+
+"""
+
+def get_column_name(var):
+    """
+    the file name of a variable, ex. "ye  " -> "ye"
+    """
+    return var.strip().replace('/','_')
+
+def write_index(fn,index):
+    """
+    write the index to a temporary file first, so readers never see a broken index
+    """
+    with open(fn+".tmp","w") as f:
+        json.dump(index,f,indent=1)
+    os.rename(fn+".tmp",fn)
+    return
+
+def append_rows(fn,rows):
+    """
+    append rows [n, ...] to a .npy file along its first axis.
+    The header is updated in place if its size does not change,
+    otherwise the file is rewritten.
+    """
+    rows = np.ascontiguousarray(rows)
+    if not os.path.exists(fn):
+        np.save(fn,rows)
+        return
+    with open(fn,"r+b") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1,0):
+            read_header  = np.lib.format.read_array_header_1_0
+            write_header = np.lib.format.write_array_header_1_0
+        else:
+            read_header  = np.lib.format.read_array_header_2_0
+            write_header = np.lib.format.write_array_header_2_0
+        shape, fortran, dtype = read_header(f)
+        offset = f.tell()
+        if shape[1:] != rows.shape[1:] or fortran:
+            raise ValueError("Cannot append rows of shape "+str(rows.shape)+
+                             " to "+fn+" of shape "+str(shape))
+        header = {"descr":np.lib.format.dtype_to_descr(dtype),
+                  "fortran_order":False,
+                  "shape":(shape[0]+len(rows),)+tuple(shape[1:])}
+        buf = io.BytesIO()
+        buf.write(np.lib.format.magic(*version))
+        write_header(buf,header)
+        fits = buf.tell() == offset
+        if fits:
+            f.seek(0,2)
+            f.write(rows.astype(dtype).tobytes())
+            f.seek(0)
+            f.write(buf.getvalue())
+    if not fits:
+        # the header grew, rewrite the whole file
+        data = np.load(fn)
+        np.save(fn+".tmp.npy",np.concatenate([data,rows.astype(data.dtype)]))
+        os.rename(fn+".tmp.npy",fn)
+    return
+
+class ColumnStore():
+    """
+    columnar store of profiles and images in directory path
+    """
+    def __init__(self,path):
+        self.path = path
+        self.index_file = os.path.join(path,"index.json")
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as f:
+                self.index = json.load(f)
+        else:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            self.index = {"variables":{}, "files":[], "images":{}}
+        return
+
+    def get_filename(self,name):
+        return os.path.join(self.path,name)
+
+    def save_index(self):
+        write_index(self.index_file,self.index)
+        return
+
+    #
+    # profiles
+    #
+    def write_profiles(self,radius,time,files,table,variables):
+        """
+        write a time series of profiles, replacing the existing one
+
+        table [ntime, nbins, nvar]: the profiles, as in time_series.py
+        """
+        table = np.asarray(table)
+        np.save(self.get_filename("radius.npy"),np.asarray(radius,dtype='f8'))
+        np.save(self.get_filename("time.npy"),np.asarray(time,dtype='f8'))
+        if not os.path.isdir(self.get_filename("profiles")):
+            os.makedirs(self.get_filename("profiles"))
+        self.index["variables"] = {}
+        for i,var in enumerate(variables):
+            name = os.path.join("profiles",get_column_name(var)+".npy")
+            np.save(self.get_filename(name),np.ascontiguousarray(table[:,:,i],dtype='f8'))
+            self.index["variables"][var] = name
+        self.index["files"] = [str(fn) for fn in files]
+        self.save_index()
+        return
+
+    def append_profile(self,fn,time,radius,profiles):
+        """
+        append the profiles of one file to the time series.
+        If fn is already in the store, its profiles are replaced in place.
+
+        profiles: dict of profiles [nbins] of each variable,
+                  ex. RadialProfile.profiles
+        """
+        variables = self.index["variables"]
+        if len(self.index["files"]) > 0:
+            # a new or a missing variable would leave the columns of different lengths
+            if set(variables.keys()) != set(profiles.keys()):
+                raise ValueError("The variables of "+str(fn)+" differ from the store")
+            if len(radius) != len(self.get_radius()):
+                raise ValueError("The radius of "+str(fn)+" differs from the store")
+
+        if str(fn) in self.index["files"]:
+            i = self.index["files"].index(str(fn))
+            column = np.load(self.get_filename("time.npy"),mmap_mode='r+')
+            column[i] = time
+            column.flush()
+            for var in profiles:
+                column = np.load(self.get_filename(variables[var]),mmap_mode='r+')
+                column[i] = profiles[var]
+                column.flush()
+            return
+
+        if len(self.index["files"]) == 0:
+            np.save(self.get_filename("radius.npy"),np.asarray(radius,dtype='f8'))
+            if not os.path.isdir(self.get_filename("profiles")):
+                os.makedirs(self.get_filename("profiles"))
+
+        append_rows(self.get_filename("time.npy"),np.array([time],dtype='f8'))
+        for var in profiles:
+            name = os.path.join("profiles",get_column_name(var)+".npy")
+            append_rows(self.get_filename(name),np.asarray(profiles[var],dtype='f8')[None,:])
+            variables[var] = name
+        self.index["files"].append(str(fn))
+        self.save_index()
+        return
+
+    def get_radius(self):
+        return np.load(self.get_filename("radius.npy"),mmap_mode='r')
+
+    def get_time(self):
+        return np.load(self.get_filename("time.npy"),mmap_mode='r')
+
+    def get_files(self):
+        return list(self.index["files"])
+
+    def get_variables(self):
+        return list(self.index["variables"].keys())
+
+    def get_profiles(self,var):
+        """
+        return the memory-mapped profiles of var [ntime, nbins]
+        """
+        return np.load(self.get_filename(self.index["variables"][var]),mmap_mode='r')
+
+    #
+    # images
+    #
+    def write_image(self,name,image,save_index=True,**info):
+        """
+        write a slice image [ny, nx]
+
+        info: extra information stored in the index, ex. var, fn, time, extent
+        save_index: if False, only return the index entry,
+                    to be added later with add_images (ex. from worker processes)
+
+        return: the index entry of the image
+        """
+        if not os.path.isdir(self.get_filename("images")):
+            os.makedirs(self.get_filename("images"))
+        fname = os.path.join("images",name+".npy")
+        np.save(self.get_filename(fname),np.asarray(image))
+        entry = {"file":fname}
+        entry.update(info)
+        if save_index:
+            self.add_images({name:entry})
+        return entry
+
+    def add_images(self,entries):
+        """
+        add image entries {name: entry} to the index
+        """
+        self.index["images"].update(entries)
+        self.save_index()
+        return
+
+    def get_images(self):
+        return list(self.index["images"].keys())
+
+    def get_image_info(self,name):
+        return dict(self.index["images"][name])
+
+    def get_image(self,name):
+        """
+        return the memory-mapped image
+        """
+        return np.load(self.get_filename(self.index["images"][name]["file"]),mmap_mode='r')
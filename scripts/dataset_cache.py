@@ -0,0 +1,110 @@
+import os
+from collections import OrderedDict
+import yt
+import add_fields as af
+from utility.timer import timer
+"""
+An in-memory LRU cache of loaded datasets, shared by the scripts.
+
+A dataset is loaded, indexed and set up (units and derived fields)
+once, and reused until it is evicted or its file is modified.
+
+ex.
+    from dataset_cache import datasets
+
+    ds  = datasets.get(fn)          # with the CCSN units and fields
+
+Extra set up functions f(ds) are applied once per dataset:
+
+    ds = datasets.get(fn,setups=[add_vr_fields])
+
+"""
+
+def add_default_fields(ds):
+    """
+    the set up of every dataset: entropy units and the CCSN fields
+    """
+    af.add_entropy_fields(ds)
+    af.add_ccsn_fields(ds,af.get_dimension(ds))
+    return ds
+
+def setup_dataset(ds,setups):
+    """
+    apply each set up function to ds once
+    """
+    done = getattr(ds,"_ccsn_setups",None)
+    if done is None:
+        done = set()
+        ds._ccsn_setups = done
+    for setup in setups:
+        name = setup.__module__+"."+setup.__name__
+        if name not in done:
+            setup(ds)
+            done.add(name)
+    return ds
+
+class DatasetCache():
+    """
+    keep the last capacity loaded datasets,
+    the least recently used one is dropped first
+
+    capacity [int]: max number of datasets in memory
+    """
+    def __init__(self,capacity=4):
+        self.capacity = capacity
+        self.data = OrderedDict()
+        self.callbacks = []
+        return
+
+    def on_evict(self,callback):
+        """
+        call callback(ds) when a dataset is dropped from the cache,
+        ex. to release the data kept for it by other modules
+        """
+        self.callbacks.append(callback)
+        return
+
+    def evict(self,ds):
+        for callback in self.callbacks:
+            callback(ds)
+        return
+
+    def get(self,fn,setups=None):
+        """
+        return the dataset of file fn, load it if not in memory
+        or if the file has been modified since it was loaded.
+
+        setups: extra set up functions f(ds), applied once per dataset
+        """
+        key   = os.path.abspath(fn)
+        mtime = os.path.getmtime(fn)
+        if key in self.data and self.data[key][0] == mtime:
+            self.data.move_to_end(key)
+            ds = self.data[key][1]
+        else:
+            if key in self.data:
+                # the file was modified
+                self.evict(self.data.pop(key)[1])
+            with timer.stage("load",fn=fn):
+                ds = yt.load(fn)
+            with timer.stage("index",fn=fn):
+                ds.index
+            setup_dataset(ds,[add_default_fields])
+            self.data[key] = (mtime,ds)
+            self.data.move_to_end(key)
+            while len(self.data) > self.capacity:
+                self.evict(self.data.popitem(last=False)[1][1])
+        if setups is not None:
+            setup_dataset(ds,setups)
+        return ds
+
+    def files(self):
+        return list(self.data.keys())
+
+    def clear(self):
+        for key in list(self.data.keys()):
+            self.evict(self.data.pop(key)[1])
+        return
+
+# the default dataset cache shared by all scripts
+datasets = DatasetCache()
@@ -0,0 +1,215 @@
+import numpy as np
+import h5py
+"""
+A lightweight reader of FLASH HDF5 (PARAMESH) files with h5py.
+
+It bypasses the yt index and units and returns the cells of the
+leaf blocks as plain numpy arrays. Use it for quick looks of the
+small 1D/2D files, where yt.load dominates the wall time.
+
+ex.
+    fr   = FlashReader("ccsn2d_hdf5_plt_cnt_0200")
+    dens = fr.get_var("dens")      # [nleaf, nzb, nyb, nxb]
+    x, y, z = fr.get_cell_centers()
+
+"""
+
+class FlashReader():
+    """
+    read leaf blocks of a FLASH file
+
+    fn [str]: the FLASH file name
+    """
+    def __init__(self,fn):
+        self.fn   = fn
+        self.f    = h5py.File(fn,'r')
+        self.time = self.get_scalar("time")
+        self.variables = [v.decode('ascii') for v in self.f['unknown names'][:,0]]
+
+        self.bbox  = self.f['bounding box'][()]
+        self.level = self.f['refine level'][()]
+        self.leaf  = np.where(self.f['node type'][()] == 1)[0]
+
+        # block size from the data layout [nblocks, nzb, nyb, nxb]
+        nzb, nyb, nxb = self.f[self.variables[0]].shape[1:]
+        self.nb  = (nxb, nyb, nzb)
+        self.dim = 3
+        if nzb == 1:
+            self.dim = 2
+            if nyb == 1:
+                self.dim = 1
+        return
+
+    def close(self):
+        self.f.close()
+        return
+
+    def get_scalar(self,name):
+        """
+        return a value in the real or integer scalars, None if not found
+        """
+        for group in ['real scalars','integer scalars']:
+            if group not in self.f:
+                continue
+            for pname, pval in self.f[group][()]:
+                if pname.decode('ascii','ignore').strip() == name:
+                    return pval
+        return None
+
+    def get_dataset(self,var):
+        """
+        return a variable of all blocks [nblocks, nzb, nyb, nxb].
+        The data is memory-mapped if it is stored contiguously,
+        so only the blocks that are used are read from disk.
+        """
+        dset = self.f[var.ljust(4)]
+        if dset.chunks is None and dset.compression is None:
+            offset = dset.id.get_offset()
+            if offset is not None:
+                return np.memmap(self.fn,dtype=dset.dtype,mode='r',
+                                 offset=offset,shape=dset.shape)
+        return dset
+
+    def get_var(self,var,blocks=None):
+        """
+        return a variable of the leaf blocks [nleaf, nzb, nyb, nxb]
+
+        blocks: block indices to read, default is all leaf blocks
+        """
+        if blocks is None:
+            blocks = self.leaf
+        return np.asarray(self.get_dataset(var)[np.sort(blocks)],dtype='f8')
+
+    def get_cell_centers(self,blocks=None):
+        """
+        return x, y, z of the cell centers [nleaf, nzb, nyb, nxb]
+        """
+        if blocks is None:
+            blocks = self.leaf
+        blocks = np.sort(blocks)
+        nxb, nyb, nzb = self.nb
+        centers = []
+        for ax, n in enumerate(self.nb):
+            left  = self.bbox[blocks,ax,0]
+            width = (self.bbox[blocks,ax,1] - left)/n
+            c = left[:,None] + (np.arange(n)+0.5)[None,:]*width[:,None]
+            shape = [len(blocks),1,1,1]
+            shape[3-ax] = n
+            c = np.broadcast_to(c.reshape(shape),(len(blocks),nzb,nyb,nxb))
+            centers.append(c)
+        return centers
+
+    def get_cell_widths(self,blocks=None):
+        """
+        return dx, dy, dz of the cells [nleaf]
+        """
+        if blocks is None:
+            blocks = self.leaf
+        blocks = np.sort(blocks)
+        return [(self.bbox[blocks,ax,1]-self.bbox[blocks,ax,0])/n
+                for ax, n in enumerate(self.nb)]
+
+    def get_cells(self,variables,blocks=None):
+        """
+        return a dict of flattened cell centers ("x", "y", "z"),
+        cell widths ("dx", "dy", "dz") and variables of the leaf blocks
+        """
+        if blocks is None:
+            blocks = self.leaf
+        ncell  = np.prod(self.nb)
+        cells  = {}
+        for ax, c in zip("xyz",self.get_cell_centers(blocks)):
+            cells[ax] = c.ravel()
+        for ax, w in zip("xyz",self.get_cell_widths(blocks)):
+            cells["d"+ax] = np.repeat(w,ncell)
+        for var in variables:
+            cells[var] = self.get_var(var,blocks).ravel()
+        return cells
+
+    def get_blocks(self,max_level=None):
+        """
+        return the blocks that cover the domain once: the leaf blocks, 
+        or with max_level, the leaf blocks up to max_level and 
+        the (parent) blocks at max_level.
+        max_level is the yt level, starting from 0 (refine level - 1).
+        """
+        if max_level is None:
+            return self.leaf
+        level = self.level-1
+        leaf  = np.zeros(len(level),dtype=bool)
+        leaf[self.leaf] = True
+        return np.where((leaf & (level < max_level)) | (level == max_level))[0]
+
+    def pixelize(self,var,xlim,ylim,shape,z=0.0,batch=1024,max_level=None):
+        """
+        map a variable of the leaf blocks on a uniform image
+
+        xlim, ylim [float,float]: the image extent
+        shape      (ny, nx):      the image size
+        z          [float]:       the z position of the slice (3D only)
+        batch      [int]:         max number of blocks per read
+        max_level  [int]:         use the coarser blocks up to this level (optional)
+
+        Only the blocks that overlap the image (and the z-plane) are read,
+        and in 3D only the cell plane at z of each block, so the memory
+        scales with the slice, not with the volume.
+
+        return: image [ny, nx], NaN outside the domain
+        """
+        ny, nx = shape
+        image = np.full(shape,np.nan)
+
+        # only the leaf blocks that overlap the image (and the z-plane)
+        candidates = self.get_blocks(max_level)
+        bb = self.bbox[candidates]
+        mask = ((bb[:,0,1] > xlim[0]) & (bb[:,0,0] < xlim[1]) &
+                (bb[:,1,1] > ylim[0]) & (bb[:,1,0] < ylim[1]))
+        if self.dim == 3:
+            mask &= (bb[:,2,0] <= z) & (bb[:,2,1] > z)
+        blocks = np.sort(candidates[mask])
+        if len(blocks) == 0:
+            return image
+
+        # the cell plane of each block at z
+        nxb, nyb, nzb = self.nb
+        planes = np.zeros(len(blocks),dtype=int)
+        if self.dim == 3:
+            z0 = self.bbox[blocks,2,0]
+            z1 = self.bbox[blocks,2,1]
+            planes = np.minimum(((z-z0)/(z1-z0)*nzb).astype(int),nzb-1)
+
+        # read the blocks of the same plane in sorted batches
+        dset = self.get_dataset(var)
+        for k in np.unique(planes):
+            kblocks = blocks[planes == k]
+            for i in range(0,len(kblocks),batch):
+                bblocks = kblocks[i:i+batch]
+                data = np.asarray(dset[bblocks,k],dtype='f8')
+                for b, values in zip(bblocks,data):
+                    self._paint_block(image,b,values,xlim,ylim)
+        return image
+
+    def _paint_block(self,image,b,values,xlim,ylim):
+        """
+        fill the pixels of image with the centers inside block b
+
+        values [nyb, nxb]: the cell values of the block in the slice
+        """
+        ny, nx = image.shape
+        nxb, nyb, nzb = self.nb
+        dxp = (xlim[1]-xlim[0])/nx
+        dyp = (ylim[1]-ylim[0])/ny
+        x0, x1 = self.bbox[b,0]
+        y0, y1 = self.bbox[b,1]
+        i0 = max(int(np.ceil((x0-xlim[0])/dxp-0.5)),0)
+        i1 = min(int(np.ceil((x1-xlim[0])/dxp-0.5)),nx)
+        j0 = max(int(np.ceil((y0-ylim[0])/dyp-0.5)),0)
+        j1 = min(int(np.ceil((y1-ylim[0])/dyp-0.5)),ny)
+        if i1 <= i0 or j1 <= j0:
+            return
+        px = xlim[0] + (np.arange(i0,i1)+0.5)*dxp
+        py = ylim[0] + (np.arange(j0,j1)+0.5)*dyp
+        ci = np.clip(((px-x0)/(x1-x0)*nxb).astype(int),0,nxb-1)
+        cj = np.clip(((py-y0)/(y1-y0)*nyb).astype(int),0,nyb-1)
+        image[j0:j1,i0:i1] = values[np.ix_(cj,ci)]
+        return
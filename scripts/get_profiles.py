@@ -1,68 +1,193 @@
 import yt
 import numpy as np
 import add_fields as af
-from scipy.interpolate import interp1d
 import matplotlib.pyplot as plt
+from utility.timer import timer
+
+def interp_profiles(radius,values,new_radius):
+    """
+    linear interpolation of many variables at once
+
+    radius     [nr]:       sorted radius of the raw data
+    values     [nvar, nr]: raw data of each variable
+    new_radius [nbins]:    radius to interpolate to
+
+    return: [nvar, nbins] array. 
+            Points outside the raw radius are clamped to the edge values.
+    """
+    values = np.atleast_2d(values)
+    if len(radius) == 1:
+        return np.repeat(values,len(new_radius),axis=1)
+
+    r   = np.clip(new_radius,radius[0],radius[-1])
+    idx = np.searchsorted(radius,r,side='right') - 1
+    idx = np.clip(idx,0,len(radius)-2)
+    r0  = radius[idx]
+    dr  = radius[idx+1] - r0
+    w   = np.divide(r-r0,dr,out=np.zeros_like(r),where=dr>0)
+    return values[:,idx]*(1.0-w) + values[:,idx+1]*w
+
+def get_moments(idx,weight,values,nbins,variance=True):
+    """
+    the weighted moments of the cells in each bin
+
+    idx    [ncell]:       the bin of each cell
+    weight [ncell]:       the weight of each cell, or a scalar
+    values [nvar][ncell]: the variables
+
+    return: [1+2*nvar, nbins] array, the rows are the sum of the weights W, 
+            the weighted means and M2 = sum w*(v-mean)^2 of each variable
+            (0 if variance is False)
+    """
+    nvar = len(values)
+    moments = np.zeros((1+2*nvar,nbins))
+    wsum = np.bincount(idx,weights=np.broadcast_to(weight,idx.shape),minlength=nbins)
+    moments[0] = wsum
+    for i,v in enumerate(values):
+        mean = np.divide(np.bincount(idx,weights=v*weight,minlength=nbins),wsum,
+                         out=np.zeros(nbins),where=wsum>0)
+        moments[1+i] = mean
+        if variance:
+            # the deviations from the bin mean do not cancel
+            dv = v-mean[idx]
+            moments[1+nvar+i] = np.bincount(idx,weights=weight*dv*dv,minlength=nbins)
+    return moments
+
+def merge_moments(a,b):
+    """
+    merge the moments of two sets of cells, see get_moments
+    (the pairwise update of Chan, Golub & LeVeque)
+    """
+    nvar = (len(a)-1)//2
+    wa, wb = a[0], b[0]
+    wsum = wa+wb
+    fb = np.divide(wb,wsum,out=np.zeros_like(wsum),where=wsum>0)
+    delta = b[1:1+nvar]-a[1:1+nvar]
+    merged = np.empty_like(a)
+    merged[0] = wsum
+    merged[1:1+nvar] = a[1:1+nvar]+delta*fb
+    merged[1+nvar:]  = a[1+nvar:]+b[1+nvar:]+delta**2*wa*fb
+    return merged
+
+class Profile():
+    """
+    radial profiles of many variables, weights and statistics
+
+    radius    [nbins]: the bin centers
+    data      dict:    {(var, stat, weight): [nbins]}
+    default_weight:    the weight of mean and variance if none is given
+                       to get, ex. the mass weight of get_profile
+    The statistics are
+
+        mean:         the weighted mean
+        variance:     the weighted variance
+        min, max:     the min and max of the cells in each bin (NaN if empty)
+        sum:          the sum of the cells in each bin, ex. the mass of cell_mass
+        accumulation: the sum within each bin, ex. the enclosed mass of cell_mass
+
+    min, max, sum and accumulation do not depend on the weight (weight=None).
+    """
+    def __init__(self,radius,default_weight=None):
+        self.radius = radius
+        self.data   = {}
+        self.default_weight = default_weight
+        return
+
+    def get(self,var,stat="mean",weight="default"):
+        """
+        weight: the weight field of mean and variance, None for the 
+                cell average, "default" for default_weight
+        """
+        if stat in ("min","max","sum","accumulation"):
+            weight = None
+        elif weight == "default":
+            weight = self.default_weight
+        return self.data[(var,stat,weight)]
+
+    def keys(self):
+        return list(self.data.keys())
 
 class RadialProfile():
     """
     Get uniform spaced radial profiles 
     Note: here we assume center located at [0,0,0]
+
+    cache: a ProfileCache to store/reuse profiles on disk (optional)
+    engine: the 2D/3D profile engine, "yt" for yt.create_profile or
+            "bincount" for get_chunked_profile
+    preview: a Preview to cap the AMR level and the region of 
+             2D/3D profiles (optional)
     """
-    def __init__(self,dr=1.e5,rmax=5.e7):
+    weight_fields = {1:None, 2:'cyl_cell_mass', 3:'cell_mass'}
+    radius_fields = {1:'sph_radius', 2:'cyl_radius', 3:'radius'}
+    statistics    = ("mean","variance","min","max","sum","accumulation")
+
+    def __init__(self,dr=1.e5,rmax=5.e7,cache=None,engine="yt",preview=None):
+        if engine not in ("yt","bincount"):
+            raise ValueError("Unknown profile engine: "+str(engine))
         self.dr     = dr
         self.rmax   = rmax
         self.nbins  = int(rmax/dr)
         self.radius = np.linspace(dr,rmax,self.nbins)
         self.profiles = {}
+        self.cache  = cache
+        self.engine = engine
+        self.preview = preview
         return
 
-    def get_1d_profile(self,ds,variables):
+    def get_sphere(self,ds):
+        """
+        return the data source of the 2d/3d profiles
+        """
+        if self.preview is not None:
+            return self.preview.get_sphere(ds,self.rmax,center=[0,0,0])
+        return ds.sphere([0,0,0], (self.rmax,"cm"))
+
+    def get_1d_profile(self,ds,variables,as_array=False):
         """
         get 1d profile
 
         input: variables: [str]
+               as_array:  if True, also return the profiles as 
+                          a 2D array [len(variables), nbins]
         """
         rmax = self.rmax
-        profiles = self.profiles
         ctr  = [0,0,0]
         pt   = [rmax,0,0]
-        ray = ds.ray(ctr,pt)
-        raw_radius = (ray['t'].in_cgs().v)*rmax
-        s1 = raw_radius.argsort()
-        raw = {}
-        for var in variables:
-            raw[var] = ray[var].in_cgs().v
-        radius = np.array(raw_radius)[s1]
-        for var in variables:
-            value  = np.array(raw[var][s1])
-            f1d = interp1d(radius,value)
-            profiles[var] = np.zeros(len(self.radius))
-            for i,r in enumerate(self.radius):
-                try:
-                    profiles[var][i] = f1d(r)
-                except:
-                    if r <= radius[0]:
-                        profiles[var][i]=value[0]
-                    if r > radius[-1]:
-                        profiles[var][i]=value[-1]
-
-        self.profiles = profiles
+        with timer.stage("ray",dim=1):
+            ray = ds.ray(ctr,pt)
+            raw_radius = (ray['t'].in_cgs().v)*rmax
+            s1 = raw_radius.argsort()
+            radius = raw_radius[s1]
+
+            # sort the ray once for all variables
+            raw = np.empty((len(variables),len(radius)))
+            for i,var in enumerate(variables):
+                raw[i] = ray[var].in_cgs().v[s1]
+
+        with timer.stage("interpolate",dim=1):
+            table = interp_profiles(radius,raw,self.radius)
+        for i,var in enumerate(variables):
+            self.profiles[var] = table[i]
+
+        if as_array:
+            return table
         return
 
     def get_2d_profile(self,ds,variables):
         """
         get radial profiles from 2d data
         """
-        source = ds.sphere([0,0,0], (self.rmax,"cm"))
-        yt_profile = yt.create_profile(source,
-                "cyl_radius",
-                variables,
-                n_bins=self.nbins,
-                extrema={'cyl_radius':(self.dr/2,self.rmax+self.dr/2)},
-                logs={'cyl_radius':False},
-                weight_field='cyl_cell_mass',
-                accumulation=False)
+        source = self.get_sphere(ds)
+        with timer.stage("create_profile",dim=2):
+            yt_profile = yt.create_profile(source,
+                    "cyl_radius",
+                    variables,
+                    n_bins=self.nbins,
+                    extrema={'cyl_radius':(self.dr/2,self.rmax+self.dr/2)},
+                    logs={'cyl_radius':False},
+                    weight_field='cyl_cell_mass',
+                    accumulation=False)
         for var in variables:
             self.profiles[var]=yt_profile[var].v
         return
@@ -71,33 +196,393 @@ class RadialProfile():
         """
         get radial profiles from 3d data
         """
-        source = ds.sphere([0,0,0], (self.rmax,"cm"))
-        yt_profile = yt.create_profile(source,
-                "radius",
-                variables,
-                n_bins=self.nbins,
-                extrema={'radius':(self.dr/2,self.rmax+self.dr/2)},
-                logs={'radius':False},
-                weight_field='cell_mass',
-                accumulation=False)
+        source = self.get_sphere(ds)
+        with timer.stage("create_profile",dim=3):
+            yt_profile = yt.create_profile(source,
+                    "radius",
+                    variables,
+                    n_bins=self.nbins,
+                    extrema={'radius':(self.dr/2,self.rmax+self.dr/2)},
+                    logs={'radius':False},
+                    weight_field='cell_mass',
+                    accumulation=False)
         for var in variables:
             self.profiles[var]=yt_profile[var].v
         return
 
-    def get_profile(self,ds,dim,variables):
+    def get_chunked_profile(self,ds,dim,variables):
+        """
+        get radial profiles by streaming the chunks of the sphere. 
+        The weighted sums of all variables are accumulated with 
+        np.bincount, so only one chunk is in memory.
+        The bins and weights are the same as in get_2d_profile and 
+        get_3d_profile, 1d profiles are cell averages.
+        """
+        rfield = self.radius_fields[dim]
+        weight = self.weight_fields[dim]
+        source = self.get_sphere(ds)
+
+        # row 0 is the sum of the weights
+        sums = np.zeros((len(variables)+1,self.nbins))
+        with timer.stage("bincount",dim=dim):
+            for chunk in yt.parallel_objects(source.chunks([],"io"),-1):
+                idx = self.get_bin_index(chunk[rfield].in_cgs().d)
+                use = idx >= 0
+                if not use.any():
+                    continue
+                idx = idx[use]
+                w   = 1.0
+                if weight is not None:
+                    w = chunk[weight].d[use]
+                sums[0] += np.bincount(idx,weights=np.broadcast_to(w,idx.shape),
+                                       minlength=self.nbins)
+                for i,var in enumerate(variables):
+                    sums[i+1] += np.bincount(idx,weights=chunk[var].d[use]*w,
+                                             minlength=self.nbins)
+                af.clear_geometry_cache()
+
+        comm = yt.communication_system.communicators[-1]
+        sums = comm.mpi_allreduce(sums,op="sum")
+        wsum = sums[0]
+        for i,var in enumerate(variables):
+            self.profiles[var] = np.divide(sums[i+1],wsum,out=np.zeros(self.nbins),where=wsum>0)
+        return
+
+    def get_multi_profile(self,ds,dim,variables,weights,stats):
+        """
+        get the profiles of many weights and statistics
+        with one pass over the chunks of the sphere.
+
+        weights [str]: weight fields, None for the cell average
+        stats   [str]: statistics, see Profile
+
+        return: a Profile
+        """
+        for stat in stats:
+            if stat not in self.statistics:
+                raise ValueError("Unknown statistic: "+str(stat))
+        rfield = self.radius_fields[dim]
+        nbins  = self.nbins
+        nvar   = len(variables)
+        moments = [stat for stat in ("mean","variance") if stat in stats]
+        do_sum  = "sum" in stats or "accumulation" in stats
+
+        # the weighted moments of each weight, see get_moments
+        wmoments = {w:np.zeros((1+2*nvar,nbins)) for w in weights}
+        vsums = np.zeros((nvar,nbins))
+        vmin  = np.full((nvar,nbins),np.inf)
+        vmax  = np.full((nvar,nbins),-np.inf)
+
+        source = self.get_sphere(ds)
+        with timer.stage("multi_profile",dim=dim,nvar=nvar,nweight=len(weights)):
+            for chunk in yt.parallel_objects(source.chunks([],"io"),-1):
+                idx = self.get_bin_index(chunk[rfield].in_cgs().d)
+                use = idx >= 0
+                if not use.any():
+                    continue
+                idx = idx[use]
+                values = [chunk[var].d[use] for var in variables]
+
+                for w in weights:
+                    if len(moments) == 0:
+                        break
+                    ww = 1.0
+                    if w is not None:
+                        ww = chunk[w].d[use]
+                    wmoments[w] = merge_moments(wmoments[w],
+                            get_moments(idx,ww,values,nbins,"variance" in stats))
+
+                for i,v in enumerate(values):
+                    if do_sum:
+                        vsums[i] += np.bincount(idx,weights=v,minlength=nbins)
+                if "min" in stats or "max" in stats:
+                    # reduce the cells of each bin after sorting them by bin
+                    order = np.argsort(idx,kind='stable')
+                    sidx  = idx[order]
+                    start = np.flatnonzero(np.r_[True,sidx[1:] != sidx[:-1]])
+                    bins  = sidx[start]
+                    for i,v in enumerate(values):
+                        sv = v[order]
+                        if "min" in stats:
+                            vmin[i,bins] = np.minimum(vmin[i,bins],np.minimum.reduceat(sv,start))
+                        if "max" in stats:
+                            vmax[i,bins] = np.maximum(vmax[i,bins],np.maximum.reduceat(sv,start))
+                af.clear_geometry_cache()
+
+        comm = yt.communication_system.communicators[-1]
+        # the mass weight of get_profile, if it is computed
+        default_weight = self.weight_fields[dim]
+        if default_weight not in weights and len(weights) > 0:
+            default_weight = weights[0]
+        profile = Profile(self.radius,default_weight)
+        for w in weights:
+            if len(moments) == 0:
+                break
+            # the moments do not add up, merge the ones of each rank
+            ranks = comm.par_combine_object([wmoments[w]],op="cat",datatype="list")
+            merged = ranks[0]
+            for other in ranks[1:]:
+                merged = merge_moments(merged,other)
+            wsum = merged[0]
+            for i,var in enumerate(variables):
+                if "mean" in stats:
+                    profile.data[(var,"mean",w)] = merged[1+i]
+                if "variance" in stats:
+                    profile.data[(var,"variance",w)] = np.divide(merged[1+nvar+i],wsum,
+                            out=np.zeros(nbins),where=wsum>0)
+        if do_sum:
+            vsums = comm.mpi_allreduce(vsums,op="sum")
+        if "min" in stats:
+            vmin = comm.mpi_allreduce(vmin,op="min")
+            vmin[np.isinf(vmin)] = np.nan
+        if "max" in stats:
+            vmax = comm.mpi_allreduce(vmax,op="max")
+            vmax[np.isinf(vmax)] = np.nan
+        for i,var in enumerate(variables):
+            if "sum" in stats:
+                profile.data[(var,"sum",None)] = vsums[i]
+            if "accumulation" in stats:
+                profile.data[(var,"accumulation",None)] = np.cumsum(vsums[i])
+            if "min" in stats:
+                profile.data[(var,"min",None)] = vmin[i]
+            if "max" in stats:
+                profile.data[(var,"max",None)] = vmax[i]
+        return profile
+
+    def get_bin_index(self,radius):
+        """
+        return the radial bin index of each radius, -1 if outside the bins.
+        The bins are the same as in get_2d_profile and get_3d_profile.
+        """
+        width = self.rmax/self.nbins
+        idx = np.floor((radius-0.5*self.dr)/width).astype(int)
+        idx[(idx < 0) | (idx >= self.nbins)] = -1
+        return idx
+
+    def get_profile_from_file(self,fn,variables):
+        """
+        get radial profiles directly from a FLASH file with FlashReader,
+        without yt. Only data variables in the file are supported.
+        """
+        import flash_reader
+        with timer.stage("read",fn=fn):
+            fr = flash_reader.FlashReader(fn)
+            dim = fr.dim
+            if dim==1:
+                cells = fr.get_cells(variables)
+            else:
+                # the density is needed for the mass weighting
+                cells = fr.get_cells(list(set(variables) | set(["dens"])))
+            fr.close()
+
         if dim==1:
-            self.get_1d_profile(ds,variables)
-        elif dim==2:
-            self.get_2d_profile(ds,variables)
-        elif dim==3:
-            self.get_3d_profile(ds,variables)
+            s1 = cells["x"].argsort()
+            raw = np.array([cells[var][s1] for var in variables])
+            table = interp_profiles(cells["x"][s1],raw,self.radius)
+            for i,var in enumerate(variables):
+                self.profiles[var] = table[i]
+            return
+
+        if dim==2:
+            radius = np.sqrt(cells["x"]**2+cells["y"]**2)
+            volume = cells["dx"]*cells["dy"]*2*np.pi*cells["x"]
         else:
+            radius = np.sqrt(cells["x"]**2+cells["y"]**2+cells["z"]**2)
+            volume = cells["dx"]*cells["dy"]*cells["dz"]
+        idx = self.get_bin_index(radius)
+        use = idx >= 0
+        idx = idx[use]
+        mass = cells["dens"][use]*volume[use]
+        wsum = np.bincount(idx,weights=mass,minlength=self.nbins)
+        for var in variables:
+            vsum = np.bincount(idx,weights=cells[var][use]*mass,minlength=self.nbins)
+            self.profiles[var] = np.divide(vsum,wsum,out=np.zeros(self.nbins),where=wsum>0)
+        return
+
+    def get_profile(self,ds,dim,variables,weights=None,stats=None):
+        """
+        get the radial profiles of variables into self.profiles.
+
+        weights [str]: weight fields, None for the cell average
+        stats   [str]: statistics, see Profile
+        If weights or stats are given, all of them are computed with 
+        one pass over the data and a Profile is returned.
+        """
+        if dim not in self.weight_fields:
             print("Error: no such dimension.", dim)
             quit()
+
+        if weights is not None or stats is not None:
+            if weights is None:
+                weights = [self.weight_fields[dim]]
+            if stats is None:
+                stats = ["mean"]
+            profile = self.get_multi_profile(ds,dim,variables,weights,stats)
+            if "mean" in stats and self.weight_fields[dim] in weights:
+                for var in variables:
+                    self.profiles[var] = profile.get(var,"mean",self.weight_fields[dim])
+            return profile
+
+        # only compute the variables that are not in the cache
+        keys = {}
+        if self.cache is not None:
+            missing = []
+            for var in variables:
+                keys[var] = self.cache.get_key(ds.parameter_filename,dim,
+                        self.dr,self.rmax,self.weight_fields[dim],var,self.preview)
+                profile = None
+                if keys[var] is not None:
+                    profile = self.cache.get(keys[var])
+                if profile is None:
+                    missing.append(var)
+                else:
+                    self.profiles[var] = profile
+            variables = missing
+            if len(variables) == 0:
+                return
+
+        with timer.stage("get_profile",dim=dim,nvar=len(variables)):
+            if dim==1:
+                self.get_1d_profile(ds,variables)
+            elif self.engine=="bincount":
+                self.get_chunked_profile(ds,dim,variables)
+            elif dim==2:
+                self.get_2d_profile(ds,variables)
+            elif dim==3:
+                self.get_3d_profile(ds,variables)
+        af.clear_geometry_cache()
+
+        for var in variables:
+            if keys.get(var) is not None:
+                self.cache.put(keys[var],self.profiles[var])
         return
 
+class AngularProfile(RadialProfile):
+    """
+    Get uniform spaced radial profiles in angular bins (theta, phi) 
+    of 2d cylindrical or 3d Cartesian data.
+    theta is the polar angle from the +z axis [0,pi] and 
+    phi is the azimuthal angle [-pi,pi] (3d only, 2d data needs nphi=1).
+    Note: here we assume center located at [0,0,0]
+
+    self.profiles[var] is a [ntheta, nphi, nbins] array, NaN in empty bins
+    """
+    def __init__(self,dr=1.e5,rmax=5.e7,ntheta=32,nphi=1,preview=None):
+        RadialProfile.__init__(self,dr,rmax,engine="bincount",preview=preview)
+        self.ntheta = ntheta
+        self.nphi   = nphi
+        self.theta  = (np.arange(ntheta)+0.5)*np.pi/ntheta
+        self.phi    = -np.pi+(np.arange(nphi)+0.5)*2*np.pi/nphi
+        return
+
+    def get_direction_index(self,chunk,dim):
+        """
+        return the (theta, phi) bin index of each cell, 
+        flattened as itheta*nphi + iphi
+        """
+        if dim==2:
+            # the cylindrical radius "r" and "z" in the 2d data
+            theta = np.arctan2(chunk["r"].d,chunk["z"].d)
+            iphi  = 0
+        else:
+            x = chunk["x"].d
+            y = chunk["y"].d
+            theta = np.arctan2(np.sqrt(x**2+y**2),chunk["z"].d)
+            phi   = np.arctan2(y,x)
+            iphi  = np.clip(((phi+np.pi)/(2*np.pi)*self.nphi).astype(int),0,self.nphi-1)
+        itheta = np.clip((theta/np.pi*self.ntheta).astype(int),0,self.ntheta-1)
+        return itheta*self.nphi + iphi
+
+    def get_profile(self,ds,dim,variables):
+        """
+        get the angular binned profiles of all variables 
+        with one streaming pass over the chunks of the sphere
+        """
+        if dim not in (2,3):
+            print("Error: angular profiles need 2d or 3d data.", dim)
+            quit()
+        if dim==2 and self.nphi > 1:
+            # the 2d data is axisymmetric, all cells would be in the first phi bin
+            raise ValueError("Angular profiles of 2d data need nphi=1, got "+str(self.nphi))
+        rfield = self.radius_fields[dim]
+        weight = self.weight_fields[dim]
+        source = self.get_sphere(ds)
+        nbins  = self.ntheta*self.nphi*self.nbins
+
+        # row 0 is the sum of the weights
+        sums = np.zeros((len(variables)+1,nbins))
+        with timer.stage("angular_profile",dim=dim,nvar=len(variables)):
+            for chunk in yt.parallel_objects(source.chunks([],"io"),-1):
+                idx = self.get_bin_index(chunk[rfield].in_cgs().d)
+                use = idx >= 0
+                if not use.any():
+                    continue
+                idx = self.get_direction_index(chunk,dim)[use]*self.nbins + idx[use]
+                w   = chunk[weight].d[use]
+                sums[0] += np.bincount(idx,weights=w,minlength=nbins)
+                for i,var in enumerate(variables):
+                    sums[i+1] += np.bincount(idx,weights=chunk[var].d[use]*w,
+                                             minlength=nbins)
+                af.clear_geometry_cache()
+
+        comm = yt.communication_system.communicators[-1]
+        sums = comm.mpi_allreduce(sums,op="sum")
+        wsum = sums[0]
+        shape = (self.ntheta,self.nphi,self.nbins)
+        for i,var in enumerate(variables):
+            profile = np.divide(sums[i+1],wsum,out=np.full(nbins,np.nan),where=wsum>0)
+            self.profiles[var] = profile.reshape(shape)
+        return
+
+    def get_solid_angles(self):
+        """
+        return the solid angle of each (theta, phi) bin [ntheta, nphi]
+        """
+        edges = np.linspace(0,np.pi,self.ntheta+1)
+        dcos  = np.cos(edges[:-1])-np.cos(edges[1:])
+        return np.outer(dcos,np.full(self.nphi,2*np.pi/self.nphi))
+
+    def get_shock_radius(self,var="entr",threshold=None):
+        """
+        find the shock radius in each direction from a profile
+        computed by get_profile.
+
+        var       [str]:   the profile to use, ex. "entr" or "radial_velocity"
+        threshold [float]: if given, the shock is the outermost bin with 
+                           var >= threshold (ex. the post-shock entropy).
+                           Otherwise, the shock is at the steepest drop of
+                           var with radius, which is the jump of both 
+                           the entropy and the radial velocity.
+
+        return: the shock radius [ntheta, nphi] (NaN if not found), and 
+                a dict of the "mean" (solid angle weighted), "min" and "max"
+        """
+        profile = self.profiles[var]
+        if threshold is not None:
+            above = profile >= threshold
+            # the last bin above the threshold in each direction
+            last  = self.nbins-1-np.argmax(above[...,::-1],axis=-1)
+            radii = np.where(above.any(axis=-1),self.radius[last],np.nan)
+        else:
+            jump  = np.diff(profile,axis=-1)
+            jump[np.isnan(jump)] = np.inf
+            i     = np.argmin(jump,axis=-1)
+            found = np.isfinite(np.min(jump,axis=-1))
+            # the shock is between the bins i and i+1
+            radii = np.where(found,0.5*(self.radius[i]+self.radius[np.minimum(i+1,self.nbins-1)]),np.nan)
+
+        valid = np.isfinite(radii)
+        stats = {"mean":np.nan,"min":np.nan,"max":np.nan}
+        if valid.any():
+            omega = self.get_solid_angles()[valid]
+            stats["mean"] = np.sum(radii[valid]*omega)/np.sum(omega)
+            stats["min"]  = np.min(radii[valid])
+            stats["max"]  = np.max(radii[valid])
+        return radii, stats
+
 if __name__=='__main__':
 
+    from dataset_cache import datasets
 
     variables = ["dens","entr", "ye  "]
 
@@ -106,8 +591,7 @@ if __name__=='__main__':
         print(" *** unit test: 1D ***")
         path = "/Volumes/Fomalhaut-01/runs/ccsn1d/170322_s20GR_iter/output"
         fn   = path+"/ccsn1d_hdf5_chk_0070"
-        ds = yt.load(fn)
-        ds = af.add_ccsn_fields(ds,1)
+        ds = datasets.get(fn)
 
         rp = RadialProfile()
         rp.get_profile(ds,1,variables)
@@ -124,8 +608,7 @@ if __name__=='__main__':
         print(" *** unit test: 2D ***")
         path = "/Users/pan/runs/ccsn2d/190216_gr"
         fn   = path+"/ccsn2d_hdf5_chk_0500"
-        ds = yt.load(fn)
-        ds = af.add_ccsn_fields(ds,2)
+        ds = datasets.get(fn)
     
         print("added fields ...")
         rp = RadialProfile()
@@ -149,8 +632,7 @@ if __name__=='__main__':
         print(" *** unit test: 3D ***")
         path = "/Users/pan/Documents/runs/ccsn3d/20170224_s40GR_LS220"
         fn   = path+"/ccsn3d_hdf5_plt_cnt_0462"
-        ds = yt.load(fn)
-        ds = af.add_ccsn_fields(ds,3)
+        ds = datasets.get(fn)
     
         rp = RadialProfile()
         rp.get_profile(ds,3,variables)
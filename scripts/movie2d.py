@@ -0,0 +1,305 @@
+import os, sys
+import glob
+import queue
+import threading
+import subprocess
+from collections import deque
+from multiprocessing import Pool
+from optparse import OptionParser
+import numpy as np
+import matplotlib as mpl
+mpl.use('Agg')
+import matplotlib.pyplot as plt
+import slice2d
+from utility.timer import timer
+"""
+A movie of 2D slices of many FLASH files.
+
+The stages are overlapped:
+
+    prefetch: a pool of processes loads and pixelizes the next files
+    render:   the main process draws the frame of the current file
+    write:    a writer thread saves the png (or pipes the frame to ffmpeg)
+
+The number of prefetched files and of frames waiting to be written
+are bounded, so the memory stays bounded.
+
+ex.
+    python movie2d.py -i "output/ccsn2d_hdf5_plt_cnt_*" -v entr -o frames
+    python movie2d.py -i "output/ccsn2d_hdf5_plt_cnt_*" -v entr --ffmpeg entr.mp4
+
+"""
+
+def get_frame_name(fn,var,outdir):
+    return os.path.join(outdir,os.path.basename(fn)+'_'+var.strip()+'.png')
+
+def load_images(fn,fields,rmax):
+    """
+    load one file and pixelize the fields of its slice
+
+    return: (fn, time, dict of images) or (fn, None, None) if failed
+    """
+    from dataset_cache import datasets
+    try:
+        ds = datasets.get(fn)
+        images = slice2d.get_slice_images(ds,fields,rmax)
+        time = float(ds.current_time.in_cgs().v)
+        # the worker only needs the images
+        datasets.clear()
+        return fn, time, images
+    except Exception as e:
+        print("Error: failed to load",fn,e)
+        return fn, None, None
+
+def _load_images(args):
+    # send the timings of this file only, with the derived field timings
+    timer.take()
+    result = load_images(*args)
+    return result, timer.take()
+
+def prefetch(args,nprocs=2):
+    """
+    yield the results of load_images for each args in order,
+    with at most nprocs files loaded ahead of the current one
+    """
+    if nprocs < 1:
+        for arg in args:
+            yield load_images(*arg)
+        return
+
+    def get(job):
+        # the timings of the workers are merged into the timer
+        result, (records, fields) = job.get()
+        timer.merge(records,fields)
+        return result
+
+    pool = Pool(nprocs)
+    pending = deque()
+    try:
+        for arg in args:
+            pending.append(pool.apply_async(_load_images,(arg,)))
+            if len(pending) > nprocs:
+                yield get(pending.popleft())
+        while len(pending) > 0:
+            yield get(pending.popleft())
+    finally:
+        pool.terminate()
+        pool.join()
+    return
+
+class FrameWriter(threading.Thread):
+    """
+    write rgba frames in a background thread, as png files or
+    into the stdin of an ffmpeg process.
+
+    maxsize [int]: max number of frames waiting to be written
+    ffmpeg  [str]: output movie file, None for png files
+    fps     [int]: frame rate of the movie
+    """
+    def __init__(self,maxsize=4,ffmpeg=None,fps=10):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.frames = queue.Queue(maxsize=maxsize)
+        self.ffmpeg = ffmpeg
+        self.fps    = fps
+        self.proc   = None
+        self.error  = None
+        return
+
+    def put(self,frame,fout=None):
+        """
+        queue a rgba frame [ny, nx, 4], blocks if the queue is full
+        """
+        if self.error is not None:
+            raise self.error
+        self.frames.put((frame,fout))
+        return
+
+    def close(self):
+        """
+        write the remaining frames and stop the thread
+        """
+        self.frames.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return
+
+    def open_ffmpeg(self,frame):
+        ny, nx = frame.shape[:2]
+        cmd = ["ffmpeg","-y","-loglevel","error",
+               "-f","rawvideo","-pix_fmt","rgba","-s",str(nx)+"x"+str(ny),
+               "-r",str(self.fps),"-i","-",
+               "-pix_fmt","yuv420p","-vf","pad=ceil(iw/2)*2:ceil(ih/2)*2",
+               self.ffmpeg]
+        return subprocess.Popen(cmd,stdin=subprocess.PIPE)
+
+    def run(self):
+        try:
+            while True:
+                item = self.frames.get()
+                if item is None:
+                    break
+                frame, fout = item
+                if self.ffmpeg is None:
+                    # write to a temporary file first, so an interrupted run leaves no broken frames
+                    plt.imsave(fout+".tmp",frame,format='png')
+                    os.rename(fout+".tmp",fout)
+                else:
+                    if self.proc is None:
+                        self.proc = self.open_ffmpeg(frame)
+                    self.proc.stdin.write(np.ascontiguousarray(frame).tobytes())
+        except Exception as e:
+            self.error = e
+            # keep draining the queue, so put() does not block forever
+            while self.frames.get() is not None:
+                pass
+        finally:
+            if self.proc is not None:
+                self.proc.stdin.close()
+                self.proc.wait()
+        return
+
+class FrameRenderer():
+    """
+    draw the frames on one figure. The axes, the image and the colorbar 
+    are created with the first frame and only updated afterwards.
+    """
+    def __init__(self,var,rmax,clim=None,take_log=False):
+        self.var  = var
+        self.rmax = rmax
+        self.clim = clim
+        self.take_log = take_log
+        self.fig  = plt.figure(1,figsize=(7,10))
+        self.fig.clf()
+        self.im   = None
+        return
+
+    def draw(self,image,time):
+        """
+        return the rgba pixels of the frame [ny, nx, 4]
+        """
+        if self.im is None:
+            plt.figure(self.fig.number)
+            slice2d.draw_image(image,self.var,self.rmax,clim=self.clim,take_log=self.take_log)
+            self.im    = plt.gca().images[0]
+            self.title = plt.title("")
+        else:
+            self.im.set_data(image)
+            if self.clim is None:
+                self.im.autoscale()
+        if time is not None:
+            self.title.set_text("Time = %.1f (ms)" % (time*1.e3))
+        self.fig.canvas.draw()
+        return np.asarray(self.fig.canvas.buffer_rgba()).copy()
+
+    def close(self):
+        plt.close(self.fig)
+        return
+
+def make_movie(files,var,rmax,outdir=".",clim=None,take_log=False,
+               nprefetch=2,nqueue=4,ffmpeg=None,fps=10):
+    """
+    draw the 2D slice of var of each file into a frame
+
+    files     [str]:   the file names, in the movie order
+    outdir    [str]:   the directory of the png frames
+    nprefetch [int]:   number of files loaded ahead by background processes
+    nqueue    [int]:   max number of frames waiting to be written
+    ffmpeg    [str]:   pipe the frames to ffmpeg and write this movie file,
+                       instead of png files (optional)
+    """
+    if ffmpeg is None:
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+        # skip the frames on disk, so an interrupted run restarts where it stopped
+        files = [fn for fn in files if not os.path.exists(get_frame_name(fn,var,outdir))]
+        if len(files) == 0:
+            return
+
+    writer = FrameWriter(maxsize=nqueue,ffmpeg=ffmpeg,fps=fps)
+    writer.start()
+    renderer = FrameRenderer(var,rmax,clim,take_log)
+    args = [(fn,[var],rmax) for fn in files]
+    nframes = 0
+    try:
+        for fn, time, images in prefetch(args,nprefetch):
+            if images is None:
+                continue
+            with timer.stage("render",fn=fn):
+                frame = renderer.draw(images[var],time)
+            with timer.stage("queue",fn=fn):
+                writer.put(frame,get_frame_name(fn,var,outdir))
+            nframes += 1
+    finally:
+        writer.close()
+        renderer.close()
+    print("Wrote",nframes,"frames.")
+    return
+
+def default(str):
+    return str + ' [Default: %default]'
+def readCommand(argv):
+    usageStr = """
+
+    USAGE: python movie2d.py -i <glob> <options>
+
+    EXAMPLE: python movie2d.py -i "output/ccsn2d_hdf5_plt_cnt_*" -v entr -r 3e7 --ffmpeg entr.mp4
+
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-i','--input',dest="input",
+            help=default('Glob pattern of the files'),default='')
+    parser.add_option('-v','--var',dest="var",
+            help=default('Plot variable.'),default='dens')
+    parser.add_option('-r','--rmax',dest="rmax",
+            help=default('Max radius to plot'),default=4e7)
+    parser.add_option('-l','--log',dest="log",action="store_true",
+            help=default('In log scale'),default=False)
+    parser.add_option('-c','--clim',dest="clim",
+            help=default('Comma separated color limits, ex. 3,15'),default='')
+    parser.add_option('-o','--outdir',dest="outdir",
+            help=default('Output directory of the png frames'),default='.')
+    parser.add_option('-p','--prefetch',dest="prefetch",
+            help=default('Number of files loaded ahead by background processes'),default=2)
+    parser.add_option('-q','--queue',dest="queue",
+            help=default('Max number of frames waiting to be written'),default=4)
+    parser.add_option('--ffmpeg',dest="ffmpeg",
+            help=default('Pipe the frames to ffmpeg and write this movie file'),default='')
+    parser.add_option('--fps',dest="fps",
+            help=default('Frame rate of the movie'),default=10)
+    parser.add_option('--trace',dest="trace",
+            help=default('Save the stage timings to this json/csv file'),default='')
+
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understand: '+str(otherjunk))
+
+    return options
+
+if __name__=='__main__':
+
+    options = readCommand(sys.argv[1:])
+    files = sorted(glob.glob(options.input))
+    if len(files) == 0:
+        print("Error: no files found.",options.input)
+        quit()
+
+    clim = None
+    if options.clim != '':
+        clim = [float(c) for c in options.clim.split(',')]
+    ffmpeg = None
+    if options.ffmpeg != '':
+        ffmpeg = options.ffmpeg
+
+    make_movie(files,options.var,float(options.rmax),
+            outdir=options.outdir,
+            clim=clim,
+            take_log=options.log,
+            nprefetch=int(options.prefetch),
+            nqueue=int(options.queue),
+            ffmpeg=ffmpeg,
+            fps=int(options.fps))
+    if options.trace != '':
+        timer.save(options.trace)
+    print("Done.")
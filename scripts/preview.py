@@ -0,0 +1,107 @@
+import numpy as np
+"""
+A quick-look preview mode for 3D data.
+
+The AMR refinement level is capped (the coarse parent blocks stand in
+for the finer ones) and the work is limited to a sphere of interest.
+The same Preview is passed to plot_a_vr, RadialProfile and yt_slice.
+
+ex.
+    pv = Preview(max_level=3,radius=3.e7)
+    rp = RadialProfile(preview=pv)
+    rp.get_profile(ds,3,["dens","entr"])
+    pv.report(ds)
+
+The levels are the yt levels, starting from 0
+(FLASH "refine level" minus one).
+"""
+
+class Preview():
+    """
+    max_level [int]:   the max AMR level used, None for all levels
+    radius    [float]: the radius of the region of interest in cm,
+                       None for the full region of each tool
+    center    [float,float,float]: the center of the region of interest
+    """
+    def __init__(self,max_level=None,radius=None,center=(0.0,0.0,0.0)):
+        self.max_level = max_level
+        self.radius    = radius
+        self.center    = list(center)
+        return
+
+    def get_radius(self,radius):
+        """
+        return the radius of a tool within the region of interest
+        """
+        if self.radius is None:
+            return radius
+        return min(radius,self.radius)
+
+    def apply(self,data_source):
+        """
+        cap the AMR level of a yt data source
+        """
+        if self.max_level is not None:
+            data_source.max_level = self.max_level
+        return data_source
+
+    def get_sphere(self,ds,radius,center=None):
+        """
+        return the level-capped sphere of radius (within the region of interest)
+        """
+        if center is None:
+            center = self.center
+        return self.apply(ds.sphere(center,(self.get_radius(radius),"cm")))
+
+    def estimate(self,ds,radius=None):
+        """
+        estimate the cost of the preview from the grids (blocks) of ds
+
+        radius: the radius of the full region, default is the whole domain
+
+        return: dict of the number of grids and cells read in the full
+                region and in the preview, the estimated speedup, and
+                the memory saved per float64 field in MB
+        """
+        index  = ds.index
+        levels = index.grid_levels.ravel()
+        le     = index.grid_left_edge.in_cgs().d
+        re     = index.grid_right_edge.in_cgs().d
+        cells  = index.grid_dimensions.prod(axis=1)
+        center = np.array(self.center,dtype='f8')
+
+        def overlap(r):
+            if r is None:
+                return np.ones(len(levels),dtype=bool)
+            # the distance from the center to the closest point of each grid
+            d = np.clip(center,le,re)-center
+            return np.sum(d**2,axis=1) <= r**2
+
+        full = overlap(radius)
+        prev = overlap(self.get_radius(radius) if radius is not None else self.radius)
+        if self.max_level is not None:
+            prev &= levels <= self.max_level
+        est = {"grids_full":int(full.sum()),
+               "grids_preview":int(prev.sum()),
+               "cells_full":int(cells[full].sum()),
+               "cells_preview":int(cells[prev].sum())}
+        est["speedup"] = est["cells_full"]/float(max(est["cells_preview"],1))
+        est["memory_saved_mb"] = (est["cells_full"]-est["cells_preview"])*8/1024.0**2
+        return est
+
+    def report(self,ds,radius=None,elapsed=None):
+        """
+        print the estimated memory and time saved by the preview
+
+        elapsed [float]: the wall time of the preview in seconds (optional)
+        """
+        est = self.estimate(ds,radius)
+        print("Preview: max level %s, radius %s cm" % (self.max_level,self.radius))
+        print("  reads %d of %d grids, %d of %d cells (%.1fx less)" %
+              (est["grids_preview"],est["grids_full"],
+               est["cells_preview"],est["cells_full"],est["speedup"]))
+        print("  saves ~%.1f MB per field" % est["memory_saved_mb"])
+        if elapsed is not None:
+            est["time_saved_s"] = elapsed*(est["speedup"]-1.0)
+            print("  saves ~%.1f s (%.1f s for the preview)" % (est["time_saved_s"],elapsed))
+        return est
@@ -0,0 +1,93 @@
+import os
+import hashlib
+import numpy as np
+"""
+A persistent on-disk cache of radial profiles.
+
+Each profile of one variable is stored as a .npy file, named by the hash of
+(path, size, mtime, dim, dr, rmax, weight field, variable), and of the
+preview settings (max level, radius, center) if the profile is a preview.
+The modification time of a cache file is used as its last access time,
+the least recently used files are removed when the cache is larger than max_size.
+
+"""
+
+class ProfileCache():
+    """
+    cache of radial profiles on disk
+
+    path     [str]: cache directory
+    max_size [int]: max size of the cache in bytes
+    """
+    def __init__(self,path=".profile_cache",max_size=1.e9):
+        self.path     = path
+        self.max_size = max_size
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        return
+
+    def get_key(self,fn,dim,dr,rmax,weight,var,preview=None):
+        """
+        return the cache key of a profile, None if fn is not a file
+
+        preview: the Preview of the profile, None for the full profile
+        """
+        if not os.path.isfile(fn):
+            return None
+        st  = os.stat(fn)
+        key = (os.path.abspath(fn),st.st_size,st.st_mtime,
+               dim,float(dr),float(rmax),weight,var)
+        if preview is not None:
+            # a preview differs from the full profile
+            key += (preview.max_level,preview.radius,[float(c) for c in preview.center])
+        key = repr(key)
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def get_filename(self,key):
+        return os.path.join(self.path,key+".npy")
+
+    def get(self,key):
+        """
+        return the cached profile, None if not found
+        """
+        fn = self.get_filename(key)
+        try:
+            profile = np.load(fn)
+        except (IOError,ValueError):
+            return None
+        # mark as recently used
+        os.utime(fn,None)
+        return profile
+
+    def put(self,key,profile):
+        fn  = self.get_filename(key)
+        tmp = fn+".tmp.npy"
+        np.save(tmp,np.asarray(profile))
+        os.rename(tmp,fn)
+        self.evict()
+        return
+
+    def evict(self):
+        """
+        remove the least recently used profiles until the cache fits in max_size
+        """
+        entries = []
+        for f in os.listdir(self.path):
+            if not f.endswith(".npy") or f.endswith(".tmp.npy"):
+                continue
+            st = os.stat(os.path.join(self.path,f))
+            entries.append((st.st_mtime,st.st_size,f))
+        total = sum([e[1] for e in entries])
+        entries.sort()
+        for mtime,size,f in entries:
+            if total <= self.max_size:
+                break
+            os.remove(os.path.join(self.path,f))
+            total -= size
+        return
+
+    def clear(self):
+        for f in os.listdir(self.path):
+            if f.endswith(".npy"):
+                os.remove(os.path.join(self.path,f))
+        return
@@ -1,31 +1,93 @@
-import yt
 import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
+from utility.timer import timer
+
+def get_slice_images(ds,fields,rmax,axis="theta",coord=None,npix=1024,preview=None):
+    """
+    pixelize many fields of a slice with one pass over the data
+
+    fields [str]: the fields to pixelize
+    axis   [str]: the slice axis, "theta" for 2D cylindrical data
+    coord  [float]: the slice coordinate, default is the domain center
+    preview: a Preview to cap the AMR level (optional)
+
+    return: dict of images [npix, npix] with extent [-rmax,rmax,-rmax,rmax]
+    """
+    if coord is None:
+        coord = ds.domain_center[ds.coordinates.axis_id[axis]]
+    slc = ds.slice(axis,coord)
+    if preview is not None:
+        preview.apply(slc)
+    # read all fields at once, the frb then only pixelizes them
+    with timer.stage("slice",nvar=len(fields)):
+        slc.get_data(fields)
+    with timer.stage("pixelize",nvar=len(fields)):
+        slc_frb = slc.to_frb((2*rmax,"cm"),npix,center=(0,0,0),height=(2*rmax,"cm"))
+        images = {}
+        for var in fields:
+            images[var] = slc_frb[var].d
+    return images
 
 def slice2d(ds,var,rmax,clim=None,take_log=False):
     """
     plot a 2d slice
     """
-    slice2d = yt.SlicePlot(ds,"theta",var,origin=('center','left','window'))
-    slc_frb = slice2d.data_source.to_frb((2*rmax,"cm"),1024,center=(0,0,0),height=(2*rmax,"cm"))
+    image = get_slice_images(ds,[var],rmax)[var]
     fig = plt.figure(1,figsize=(7,10))
     plt.cla()
     plt.clf()
+    draw_image(image,var,rmax,clim=clim,take_log=take_log)
+    return fig
+
+def slice2d_multi(ds,fields,rmax,clims=None,take_logs=None,draw=True):
+    """
+    plot 2d slices of many fields side by side.
+    The fields are pixelized together with one pass over the data.
+
+    fields    [str]:  the fields to plot
+    clims     dict:   color limits of each field (optional)
+    take_logs dict:   log scale of each field (optional)
+    draw      [bool]: if False, only return the images
+
+    return: dict of images, and the figure (None if draw=False)
+    """
+    images = get_slice_images(ds,fields,rmax)
+    if not draw:
+        return images, None
+    if clims is None:
+        clims = {}
+    if take_logs is None:
+        take_logs = {}
+
+    fig = plt.figure(1,figsize=(5*len(fields),10))
+    plt.cla()
+    plt.clf()
+    for i,var in enumerate(fields):
+        plt.subplot(1,len(fields),i+1)
+        draw_image(images[var],var,rmax,
+                clim=clims.get(var),take_log=take_logs.get(var,False))
+    plt.tight_layout()
+    return images, fig
+
+def draw_image(image,var,rmax,clim=None,take_log=False):
+    """
+    draw a 2d slice image on the current axes
+    """
     if take_log==False:
-        plt.imshow(slc_frb[var].d,extent=[-rmax,rmax,-rmax,rmax],
+        plt.imshow(image,extent=[-rmax,rmax,-rmax,rmax],
                interpolation='nearest',
                aspect=1.0,
                cmap='Spectral_r',
-               origin='center')
+               origin='lower')
     else:
-        plt.imshow(slc_frb[var].d,extent=[-rmax,rmax,-rmax,rmax],
+        plt.imshow(image,extent=[-rmax,rmax,-rmax,rmax],
                interpolation='nearest',
                aspect=1.0,
                cmap='Spectral_r',
                norm=mpl.colors.LogNorm(),
-               origin='center')
-            
+               origin='lower')
+
     plt.xlim([0,rmax])
     plt.ylim([-rmax,rmax])
     if clim != None:
@@ -34,4 +96,4 @@ def slice2d(ds,var,rmax,clim=None,take_log=False):
     cbar.ax.set_ylabel(var,rotation=270,labelpad=25)
     plt.xlabel("R [cm]")
     plt.ylabel("Z [cm]")
-    return fig
+    return
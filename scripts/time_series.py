@@ -0,0 +1,178 @@
+import os, sys
+import glob
+import numpy as np
+import h5py
+import yt
+from multiprocessing import Pool
+from optparse import OptionParser
+import add_fields as af
+from get_profiles import RadialProfile
+from dataset_cache import datasets
+from column_store import ColumnStore
+"""
+Radial profiles of many FLASH checkpoints collected into one HDF5 file.
+
+The output file contains
+
+    profiles  [ntime, nbins, nvar]
+    time      [ntime]
+    radius    [nbins]
+    variables [nvar]
+    files     [ntime]
+    failed    the files that could not be processed
+
+With --format=npy the profiles are written into a ColumnStore 
+directory instead, with one memory-mappable file per variable.
+
+"""
+
+def get_file_list(path):
+    """
+    return a sorted list of FLASH files from a directory or a glob pattern
+    """
+    if os.path.isdir(path):
+        files = glob.glob(os.path.join(path,'*_hdf5_plt_cnt_*'))
+        files += glob.glob(os.path.join(path,'*_hdf5_chk_*'))
+    else:
+        files = glob.glob(path)
+    return sorted(files)
+
+def get_a_profile(fn,dim,variables,dr=1.e5,rmax=5.e7):
+    """
+    get the radial profiles of one file
+
+    return: (fn, time, profiles [nbins, nvar]) or (fn, None, None) if failed
+    """
+    try:
+        ds = datasets.get(fn)
+        if dim is None:
+            dim = af.get_dimension(ds)
+        rp = RadialProfile(dr=dr,rmax=rmax)
+        rp.get_profile(ds,dim,variables)
+        table = np.array([rp.profiles[var] for var in variables]).T
+        return fn, float(ds.current_time.in_cgs().v), table
+    except Exception as e:
+        print("Error: failed to process",fn,e)
+        return fn, None, None
+    finally:
+        # each file is read once, keep only one file in memory
+        datasets.clear()
+        af.clear_geometry_cache()
+
+def _get_a_profile(args):
+    return get_a_profile(*args)
+
+def get_time_series(files,variables,fout,dim=None,dr=1.e5,rmax=5.e7,nprocs=1,fmt="hdf5"):
+    """
+    get the radial profiles of many files and write them into one HDF5 file
+
+    files     [str]: file names
+    variables [str]: variables
+    fout      [str]: output HDF5 file name
+    dim       [int]: the dimension of the data, None for auto detection
+    nprocs    [int]: number of processes.
+                     Under MPI (yt.enable_parallelism()) the MPI ranks are used instead.
+    fmt       [str]: "hdf5" for one HDF5 file, or "npy" for a memory-mappable
+                     ColumnStore directory (see column_store.py)
+    """
+    args = [(fn,dim,variables,dr,rmax) for fn in files]
+    if yt.communication_system.communicators[-1].size > 1:
+        storage = {}
+        for sto, arg in yt.parallel_objects(args,storage=storage):
+            sto.result = get_a_profile(*arg)
+        results = [storage[i] for i in sorted(storage.keys())]
+        if not yt.is_root():
+            return
+    elif nprocs > 1:
+        pool = Pool(nprocs)
+        results = pool.map(_get_a_profile,args,chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        results = [get_a_profile(*arg) for arg in args]
+
+    good   = [r for r in results if r[1] is not None]
+    failed = [r[0] for r in results if r[1] is None]
+    good.sort(key=lambda r: r[1])
+
+    radius = RadialProfile(dr=dr,rmax=rmax).radius
+    if fmt == "npy":
+        store = ColumnStore(fout)
+        table = np.zeros((len(good),len(radius),len(variables)))
+        for i,r in enumerate(good):
+            table[i] = r[2]
+        store.index["failed"] = failed
+        store.write_profiles(radius,[r[1] for r in good],[r[0] for r in good],table,variables)
+        print("Processed",len(good),"files, failed",len(failed),"files.")
+        return
+
+    with h5py.File(fout,'w') as f:
+        f.create_dataset('radius',data=radius)
+        f.create_dataset('time',data=np.array([r[1] for r in good]))
+        profiles = f.create_dataset('profiles',(len(good),len(radius),len(variables)),dtype='f8')
+        for i,r in enumerate(good):
+            profiles[i] = r[2]
+        f.create_dataset('variables',data=np.array(variables,dtype='S'))
+        f.create_dataset('files',data=np.array([r[0] for r in good],dtype='S'))
+        f.create_dataset('failed',data=np.array(failed,dtype='S'))
+
+    print("Processed",len(good),"files, failed",len(failed),"files.")
+    return
+
+def default(str):
+    return str + ' [Default: %default]'
+def readCommand(argv):
+    usageStr = """
+
+    USAGE: python time_series.py -i <directory or glob> <options>
+
+    EXAMPLE: python time_series.py -i "output/ccsn2d_hdf5_plt_cnt_*" -v "dens,entr,ye  " -p 8
+
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-i','--input',dest="input",
+            help=default('Data directory or glob pattern'),default='.')
+    parser.add_option('-v','--var',dest="var",
+            help=default('Comma separated variables.'),default='dens,entr,ye  ')
+    parser.add_option('-d','--dim',dest="dim",
+            help=default('Dimension of the data, 0 for auto detection'),default=0)
+    parser.add_option('--dr',dest="dr",
+            help=default('Radial bin size'),default=1.e5)
+    parser.add_option('-r','--rmax',dest="rmax",
+            help=default('Max radius'),default=5.e7)
+    parser.add_option('-o','--output',dest="output",
+            help=default('Output HDF5 file, or directory with --format=npy'),default='profiles.h5')
+    parser.add_option('--format',dest="format",
+            help=default('Output format: hdf5, or npy for a memory-mappable column store'),default='hdf5')
+    parser.add_option('-p','--nprocs',dest="nprocs",
+            help=default('Number of processes'),default=1)
+    parser.add_option('--mpi',dest="mpi",action="store_true",
+            help=default('Use MPI ranks instead of a process pool'),default=False)
+
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understand: '+str(otherjunk))
+
+    return options
+
+if __name__=='__main__':
+
+    options = readCommand(sys.argv[1:])
+    if options.mpi:
+        yt.enable_parallelism()
+
+    files = get_file_list(options.input)
+    if len(files) == 0:
+        print("Error: no files found.",options.input)
+        quit()
+
+    dim = int(options.dim)
+    if dim == 0:
+        dim = None
+
+    get_time_series(files,options.var.split(','),options.output,
+            dim=dim,
+            dr=float(options.dr),
+            rmax=float(options.rmax),
+            nprocs=int(options.nprocs),
+            fmt=options.format)
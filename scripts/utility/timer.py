@@ -0,0 +1,164 @@
+import os
+import csv
+import json
+import time
+import resource
+import functools
+from contextlib import contextmanager
+"""
+Stage-level timing and memory instrumentation.
+
+Each stage records the wall time, the CPU time and the peak RSS of the
+process at the end of the stage. The cost is a few microseconds per 
+stage, so it can be left on.
+
+ex.
+    from utility.timer import timer
+
+    with timer.stage("load",fn=fn):
+        ds = yt.load(fn)
+    ...
+    timer.save("trace.json")   # or trace.csv
+
+Derived fields wrapped with timer.field are timed per call and
+summed per field, since they are evaluated once per chunk.
+
+"""
+
+def get_peak_rss():
+    """
+    return the peak resident set size of this process in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if os.uname()[0] == "Darwin":
+        return peak/1024.0**2  # bytes
+    return peak/1024.0         # kB
+
+class Timer():
+    """
+    record the wall time, cpu time and peak memory of stages
+    """
+    def __init__(self):
+        self.enabled = True
+        self.reset()
+        return
+
+    def reset(self):
+        self.records = []
+        self.fields  = {}
+        self.t_start = time.perf_counter()
+        return
+
+    @contextmanager
+    def stage(self,name,**info):
+        """
+        time the code in a with block as the stage name.
+        info: extra information stored with the record, ex. fn=...
+        """
+        if not self.enabled:
+            yield
+            return
+        wall0 = time.perf_counter()
+        cpu0  = time.process_time()
+        try:
+            yield
+        finally:
+            record = {"stage":name,
+                      "start":wall0-self.t_start,
+                      "wall":time.perf_counter()-wall0,
+                      "cpu":time.process_time()-cpu0,
+                      "peak_rss_mb":get_peak_rss()}
+            record.update(info)
+            self.records.append(record)
+        return
+
+    def field(self,function):
+        """
+        wrap a derived field function to sum its evaluation time
+        """
+        name = function.__name__
+        @functools.wraps(function)
+        def timed_function(field,data):
+            if not self.enabled:
+                return function(field,data)
+            wall0 = time.perf_counter()
+            cpu0  = time.process_time()
+            value = function(field,data)
+            stat = self.fields.setdefault(name,{"calls":0,"wall":0.0,"cpu":0.0})
+            stat["calls"] += 1
+            stat["wall"]  += time.perf_counter()-wall0
+            stat["cpu"]   += time.process_time()-cpu0
+            return value
+        return timed_function
+
+    def take(self):
+        """
+        return the records and the derived field timings so far, and clear them.
+        Used by worker processes to send their timings to the parent.
+        """
+        records, fields = self.records, self.fields
+        self.records = []
+        self.fields  = {}
+        return records, fields
+
+    def merge(self,records,fields=None):
+        """
+        add the records and the derived field timings of another process
+        """
+        self.records.extend(records)
+        for name, stat in (fields or {}).items():
+            total = self.fields.setdefault(name,{"calls":0,"wall":0.0,"cpu":0.0})
+            for key in total:
+                total[key] += stat[key]
+        return
+
+    def get_trace(self):
+        """
+        return all records, including the summed derived field timings
+        """
+        trace = list(self.records)
+        for name in sorted(self.fields.keys()):
+            stat = self.fields[name]
+            trace.append({"stage":"field:"+name,"calls":stat["calls"],
+                          "wall":stat["wall"],"cpu":stat["cpu"]})
+        return trace
+
+    def save(self,fn):
+        """
+        save the trace to a json or csv file (by the file extension)
+        """
+        trace = self.get_trace()
+        if fn.endswith(".csv"):
+            keys = []
+            for record in trace:
+                for key in record:
+                    if key not in keys:
+                        keys.append(key)
+            with open(fn,"w") as f:
+                writer = csv.DictWriter(f,fieldnames=keys)
+                writer.writeheader()
+                writer.writerows(trace)
+        else:
+            with open(fn,"w") as f:
+                json.dump(trace,f,indent=1,default=str)
+        return
+
+    def summary(self):
+        """
+        print the total wall and cpu time of each stage
+        """
+        totals = {}
+        for record in self.get_trace():
+            t = totals.setdefault(record["stage"],[0,0.0,0.0])
+            t[0] += record.get("calls",1)
+            t[1] += record["wall"]
+            t[2] += record["cpu"]
+        print("%-30s %8s %10s %10s" % ("stage","calls","wall [s]","cpu [s]"))
+        for name in totals:
+            calls, wall, cpu = totals[name]
+            print("%-30s %8d %10.4f %10.4f" % (name,calls,wall,cpu))
+        print("peak RSS: %.1f MB" % get_peak_rss())
+        return
+
+# the default timer shared by all scripts
+timer = Timer()
@@ -2,16 +2,25 @@ import matplotlib as mpl
 mpl.use('Agg')
 import yt
 yt.enable_parallelism()
-import string
+import os
+import json
+import zipfile
 import numpy as np
+from collections import OrderedDict
 from yt.visualization.volume_rendering.transfer_function_helper import *
 from yt.visualization.volume_rendering.api import LineSource
 from yt.utilities.amr_kdtree.api import AMRKDTree
+from yt.utilities.lib.partitioned_grid import PartitionedGrid
 from yt.units.dimensions import mass, energy, temperature
 from yt.units import cm
+from multiprocessing import Pool
+from time import perf_counter
 import sys
 sys.path.insert(0,'..')
 from my_volume_rendering_setting import *
+from utility.timer import timer
+from dataset_cache import datasets, setup_dataset, add_default_fields
+from add_fields import KB_BY, is_compact, get_buffer, new_field, get_cgs
 """
 Volume rendering plot.
 
@@ -23,89 +32,214 @@ def get_fn(path,header,cycle):
     """
     return the file name. here we assume using plt files
     """
-    return path+'/'+header+'_hdf5_plt_cnt_'+string.zfill(cycle,4)
+    return path+'/'+header+'_hdf5_plt_cnt_'+str(cycle).zfill(4)
 
-def plot_a_vr(path,header,cycle,use_ghost_zones=True,annotate=True,rotate=False,zoom=False):
+# the AMRKDTree bricks of each (dataset, field, region, ghost zones, MPI rank),
+# shared by all scenes and frames in this process.
+# Each tree keeps its dataset alive, so only the last BRICK_CACHE_SIZE trees
+# are kept, and the trees of a dataset are dropped when the dataset cache evicts it.
+BRICK_CACHE_SIZE = 4
+_brick_cache = OrderedDict()
+
+def get_dataset_id(ds):
     """
-    volume rendering plot
+    the identity of a dataset. The data objects only keep a weak proxy
+    of their dataset, so the identity of its index is used.
+    """
+    return id(ds.index)
 
-    path [string]  : the path of data files
-    header [string]: the header of the data file
-    cycle [int]    : the data cycle
+def release_bricks(ds=None):
+    """
+    drop the cached bricks of ds, or of all datasets
+    """
+    for key in list(_brick_cache.keys()):
+        if ds is None or key[0] == get_dataset_id(ds):
+            del _brick_cache[key]
+    return
 
-    ex. for file: /data/ccsn3d_hdf5_plt_cnt_0100
+datasets.on_evict(release_bricks)
 
-        path   = "/data"
-        header = "ccsn3d"
-        cycle  = 100
+def get_brick_info(data_source,field,log_field,use_ghost_zones):
+    """
+    return the parameters that define the bricks of a brick file:
+    the region, the field and its definition, and the data file
+    """
+    ds    = data_source.ds
+    mtime = None
+    if os.path.exists(str(ds.parameter_filename)):
+        mtime = os.path.getmtime(ds.parameter_filename)
+    return {"file":str(ds.parameter_filename), "mtime":mtime,
+            "field":str(field), "log_field":bool(log_field),
+            "use_ghost_zones":bool(use_ghost_zones),
+            "center":[float(c) for c in data_source.center.to('cm').v],
+            "radius":float(data_source.radius.to('cm').v),
+            "max_level":data_source._max_level,
+            "pns_density":float(PNS_DENSITY), "pns_entr":float(PNS_ENTR)}
+
+def get_volume(data_source,field,log_field,use_ghost_zones,brick_file=None):
     """
+    return the AMRKDTree of the data source with all bricks built.
 
-    fn = get_fn(path,header,cycle)
-    ds = yt.load(fn)
+    The tree is kept in memory, so the (slow) ghost zone bricks are built
+    only once for all frames and scenes of the same region.
+    If brick_file is given, the bricks are loaded from it if it exists
+    and was stored with the same parameters (see get_brick_info), 
+    otherwise they are stored into it after they are built.
+    """
+    comm = yt.communication_system.communicators[-1]
+    # the AMR level may be capped by a preview
+    max_level = data_source._max_level
+    key  = (get_dataset_id(data_source.ds),str(field),tuple(data_source.center.to('cm').v),
+            float(data_source.radius.to('cm').v),log_field,use_ghost_zones,
+            max_level,comm.rank,comm.size)
+    if key in _brick_cache:
+        _brick_cache.move_to_end(key)
+        return _brick_cache[key]
+
+    volume = AMRKDTree(data_source.ds,max_level=max_level,data_source=data_source)
+    # one file per process: within parallel_objects, each rank may build
+    # its own tree with a sub-communicator of size 1
+    world = yt.communication_system.communicators[0]
+    if brick_file is not None and world.size > 1:
+        brick_file = brick_file.replace('.npz','_'+str(world.rank)+'_'+str(world.size)+'.npz')
+    info = get_brick_info(data_source,field,log_field,use_ghost_zones)
+    info["partition"] = [comm.rank,comm.size]
+    loaded = False
+    if brick_file is not None and os.path.exists(brick_file):
+        loaded = load_bricks(volume,field,log_field,use_ghost_zones,brick_file,info)
+    if not loaded:
+        volume.set_fields([field],[log_field],no_ghost=(not use_ghost_zones))
+        if brick_file is not None:
+            store_bricks(volume,brick_file,info)
+    # the vertex centered data is already copied into the bricks
+    volume.current_vcds = []
+    volume.current_saved_grids = []
+    _brick_cache[key] = volume
+    while len(_brick_cache) > BRICK_CACHE_SIZE:
+        _brick_cache.popitem(last=False)
+    return volume
+
+def store_bricks(volume,fn,info=None):
+    """
+    store the bricks of an AMRKDTree into a npz file,
+    with the parameters info that define them
+    """
+    arrays = {"info":np.array(json.dumps(info,sort_keys=True))}
+    for node in volume.tree.trunk.kd_traverse():
+        brick = volume.get_brick_data(node)
+        nid = str(node.node_id)
+        arrays['data_'+nid] = brick.my_data[0]
+        arrays['mask_'+nid] = brick.source_mask
+    tmp = fn.replace('.npz','.tmp.npz')
+    np.savez(tmp,**arrays)
+    os.rename(tmp,fn)
+    return
 
-    # register new units for entropy
-    ds.unit_registry.add('kB',1.3806488e-16,dimensions=energy/temperature,tex_repr='k_{B}')
-    ds.unit_registry.add('by',1.674e-24,dimensions=mass,tex_repr='baryon')
+def load_bricks(volume,field,log_field,use_ghost_zones,fn,info=None):
+    """
+    load the bricks of an AMRKDTree stored by store_bricks
 
-    # create a new derived field: Entropy
-    def _entr(field,data):
-        """
-	fixed the entropy units in flash
-        """
-        entr = data["entr"]
-        kb_by = yt.YTQuantity(1,'erg')/yt.YTQuantity(1,'K')/yt.YTQuantity(1,'g')*(1.3806488e-16/1.674e-24)
-        return entr*kb_by
-    ds.add_field("Entr",function=_entr,units="kB/by",
-            display_name="Entropy",
-            dimensions=energy/temperature/mass)
+    return: False (and the tree is not changed) if the file cannot be read,
+            or was stored with other parameters than info or for another tree
+    """
+    try:
+        with np.load(fn) as npz:
+            f = {k:npz[k] for k in npz.files}
+    except (OSError,ValueError,EOFError,zipfile.BadZipFile) as e:
+        print("Warning: cannot read the bricks of",fn,"("+str(e)+"), rebuild them")
+        return False
+    if "info" not in f or str(f["info"]) != json.dumps(info,sort_keys=True):
+        print("Warning: the bricks of",fn,"are out of date, rebuild them")
+        return False
+    nodes  = list(volume.tree.trunk.kd_traverse())
+    stored = set(k[len('data_'):] for k in f if k.startswith('data_'))
+    if stored != set(str(node.node_id) for node in nodes):
+        print("Warning: the bricks of",fn,"do not match the tree, rebuild them")
+        return False
+    bricks = []
+    for node in nodes:
+        nid  = str(node.node_id)
+        data = f['data_'+nid]
+        nle  = node.get_left_edge()
+        nre  = node.get_right_edge()
+        dims = np.array(data.shape,dtype='int64') - 1
+        node.data = PartitionedGrid(node.grid,[data],f['mask_'+nid],
+                                    nle.copy(),nre.copy(),dims)
+        node.dirty = False
+        bricks.append(node.data)
+        volume.brick_dimensions.append(dims)
+    volume.fields      = volume.data_source._determine_fields([field])
+    volume.log_fields  = [log_field]
+    volume.no_ghost    = not use_ghost_zones
+    volume.bricks      = np.array(bricks)
+    volume.brick_dimensions = np.array(volume.brick_dimensions)
+    volume._initialized = True
+    return True
+
+def get_field_range(data_source,field,bounds=(0.0,100.0),nbins=10000,percentiles=(99.9,)):
+    """
+    find the range of a field with one streaming pass over the chunks of data_source
 
-    # create a new derived field: Entropy
-    def _entrdens(field,data):
-        """
-        create a new derived field to show both entropy and density
+    A fixed-bin histogram within bounds (plus under/overflow bins) is
+    accumulated chunk by chunk, so the percentiles are accurate to
+    (bounds[1]-bounds[0])/nbins. The min and max are exact.
+    A percentile outside bounds is in the under/overflow bin, so it
+    is returned as min or max, with a warning: the bounds must cover
+    the values of interest (the default is for the entropy in kB/by).
 
-        if density > PNS_DENSITY:
-            entropy = PNS_ENTR
+    return: min, max, and a dict of the percentiles
+    """
+    lo, hi = bounds
+    hist = np.zeros(nbins+2)
+    vmin = np.inf
+    vmax = -np.inf
+    for chunk in yt.parallel_objects(data_source.chunks([],"io"),-1):
+        values = chunk[field].d
+        if values.size == 0:
+            continue
+        vmin = min(vmin,values.min())
+        vmax = max(vmax,values.max())
+        idx  = np.clip(np.floor((values-lo)/(hi-lo)*nbins).astype(int)+1,0,nbins+1)
+        hist += np.bincount(idx,minlength=nbins+2)
+
+    comm = yt.communication_system.communicators[-1]
+    hist = comm.mpi_allreduce(hist,op="sum")
+    vmin = comm.mpi_allreduce(vmin,op="min")
+    vmax = comm.mpi_allreduce(vmax,op="max")
+
+    # bin i (1..nbins) covers [lo+(i-1)*dv, lo+i*dv]
+    dv   = (hi-lo)/nbins
+    cdf  = np.cumsum(hist)/max(hist.sum(),1)
+    values = {}
+    for p in percentiles:
+        i = np.searchsorted(cdf,p/100.0)
+        if i == 0 or i > nbins:
+            # in the under/overflow bin, only the min (0) and max (100) are exact
+            if 0.0 < p < 100.0:
+                print("Warning: the",p,"percentile of",field,"is outside the bounds",bounds)
+            values[p] = vmin if i == 0 else vmax
         else:
-            entropy = entropy
-
-        """
-        dens = data["dens"]
-        entr = data["entr"]
-        entrdens = entr*(np.exp(-(dens.in_cgs()/PNS_DENSITY)**5))+PNS_ENTR
-        kb_by = yt.YTQuantity(1,'erg')/yt.YTQuantity(1,'K')/yt.YTQuantity(1,'g')*(1.3806488e-16/1.674e-24)
-        return entrdens*kb_by
-    ds.add_field("Entropy",function=_entrdens,units="kB/by",
-            display_name="Entropy",
-            dimensions=energy/temperature/mass)
-
-    #debug: also plot a entropy slice 
-    if yt.is_root():
-        pc = yt.SlicePlot(ds,'z','Entr')
-        pc.zoom(40)
-        pc.set_log('Entr',False)
-        pc.save('fig_slice_z_'+header+'_'+string.zfill(cycle,4)+'.png')
-
-    # get the entropy range from time
-    time = ds.current_time.in_cgs().v - TSHIFT
-
-    if CUSTOM_EMAX:
-        emin, emax = get_emin_emax(time)
-    else:
-        entropy_max, pe = ds.find_max('Entropy')
-        emax = entropy_max.v - 1.0
-        emin = emax - 3.0
-
-    if yt.is_root():
-        print "emin/emax:",emin,emax
-        # check if emax > emin
-        if emax <= emin:
-            print "Error: emax <= emin"
-            quit()
+            values[p] = min(max(lo+i*dv,vmin),vmax)
+    return vmin, vmax, values
 
+def create_vr_scene(ds,emin,emax,time,use_ghost_zones=True,brick_file=None,bounds=None,preview=None):
+    """
+    create the volume rendering scene of the Entropy field
+
+    ds    : the dataset with the Entropy field
+    emin, emax [float]: the entropy range
+    time  [float]: the time after bounce
+    brick_file [string]: a file to keep the volume bricks between runs (optional)
+    bounds (float,float): the transfer function bounds, 
+                          default is the Entropy range of the whole domain
+    preview : a Preview to cap the AMR level and the rendered region (optional)
+    """
     # only render the region with r < 1.e8 cm
     # this is necessary if we want to include ghost zones
-    sphere = ds.sphere([0,0,0],(1.e8, 'cm'))
+    if preview is not None:
+        sphere = preview.get_sphere(ds,1.e8)
+    else:
+        sphere = ds.sphere([0,0,0],(1.e8, 'cm'))
     sc = yt.create_scene(sphere, field='Entropy')
 
     # set the camera resolution and width
@@ -130,7 +264,7 @@ def plot_a_vr(path,header,cycle,use_ghost_zones=True,annotate=True,rotate=False,
     # create a transfer function helper
     tfh = TransferFunctionHelper(ds)
     tfh.set_field('Entropy')
-    tfh.set_bounds()
+    tfh.set_bounds(bounds)
     tfh.set_log(False)
     tfh.build_transfer_function()
 
@@ -158,12 +292,144 @@ def plot_a_vr(path,header,cycle,use_ghost_zones=True,annotate=True,rotate=False,
     source.set_transfer_function(tfh.tf)
     source.grey_opacity=True
 
+    # reuse the bricks built for the same region
+    source._volume = get_volume(sphere,source.field,source.log_field,
+                                use_ghost_zones,brick_file)
+    source._volume_valid = True
+
+    return sc
+
+# create a new derived field: Entropy
+def _entrdens(field,data):
+    """
+    create a new derived field to show both entropy and density
+
+    if density > PNS_DENSITY:
+        entropy = PNS_ENTR
+    else:
+        entropy = entropy
+
+    """
+    dens = data["dens"]
+    entr = data["entr"]
+    if is_compact():
+        # entr*exp(-(dens/PNS_DENSITY)**5)+PNS_ENTR in place, already in kB/by
+        tmp = get_buffer("tmp",dens.shape)
+        np.divide(get_cgs(dens),PNS_DENSITY,out=tmp)
+        np.power(tmp,5,out=tmp)
+        np.negative(tmp,out=tmp)
+        np.exp(tmp,out=tmp)
+        tmp *= entr.d
+        tmp += PNS_ENTR
+        value = new_field(data,dens.shape,"kB/by")
+        value.view(np.ndarray)[...] = tmp
+        return value
+    entrdens = entr*(np.exp(-(dens.in_cgs()/PNS_DENSITY)**5))+PNS_ENTR
+    return entrdens*KB_BY
+
+def add_vr_fields(ds):
+    """
+    add the Entropy field of the volume rendering.
+    The kB/by units and the Entr field are added by the dataset cache.
+    """
+    ds.add_field(("gas","Entropy"),function=timer.field(_entrdens),sampling_type="cell",units="kB/by",
+            display_name="Entropy",
+            dimensions=energy/temperature/mass)
+    return ds
+
+def plot_a_vr(path,header,cycle,use_ghost_zones=True,annotate=True,rotate=False,zoom=False,nprocs=1,
+              cache_bricks=False,emax_percentile=None,ds=None,trace=None,preview=None,
+              progressive=False,budget=None,tolerance=None,entropy_bounds=(0.0,100.0)):
+    """
+    volume rendering plot
+
+    path [string]  : the path of data files
+    header [string]: the header of the data file
+    cycle [int]    : the data cycle
+    nprocs [int]   : number of processes to render the rotation/zoom frames,
+                     the MPI ranks are used instead when running with MPI
+    cache_bricks [bool]: keep the volume bricks in a file for later renders
+                         of the same cycle
+    emax_percentile [float]: use this percentile of the entropy (ex. 99.9) 
+                             instead of its max to set emax
+    entropy_bounds (float,float): the entropy range of the percentile histogram,
+                                  the percentiles outside it are clamped to the
+                                  min/max entropy (see get_field_range)
+    ds : an already loaded dataset to use instead of the file (optional)
+    trace [string] : save the stage timings to this json/csv file (optional)
+    preview : a Preview to cap the AMR level and the rendered region for
+              a quick look (optional)
+    progressive [bool]: render the image at increasing resolutions up to
+                        VR_RESOLUTION, the image is written after each pass
+    budget [float]   : progressive: the max render time in seconds (optional)
+    tolerance [float]: progressive: stop when the image changes less than this
+                       between two passes, ex. 0.02 (optional)
+
+    ex. for file: /data/ccsn3d_hdf5_plt_cnt_0100
+
+        path   = "/data"
+        header = "ccsn3d"
+        cycle  = 100
+    """
+
+    t_start = perf_counter()
+    if ds is None:
+        ds = datasets.get(get_fn(path,header,cycle),setups=[add_vr_fields])
+    else:
+        setup_dataset(ds,[add_default_fields,add_vr_fields])
+
+    #debug: also plot a entropy slice 
+    if yt.is_root():
+        pc = yt.SlicePlot(ds,'z','Entr')
+        pc.zoom(40)
+        pc.set_log('Entr',False)
+        pc.save('fig_slice_z_'+header+'_'+str(cycle).zfill(4)+'.png')
+
+    # get the entropy range from time
+    time = ds.current_time.in_cgs().v - TSHIFT
+
+    # only the region with r < 1.e8 cm is rendered, 
+    # find the entropy range there with one pass
+    if preview is not None:
+        sphere = preview.get_sphere(ds,1.e8)
+    else:
+        sphere = ds.sphere([0,0,0],(1.e8, 'cm'))
+    with timer.stage("field_range"):
+        entropy_min, entropy_max, pe = get_field_range(sphere,'Entropy',
+                bounds=entropy_bounds,percentiles=[emax_percentile or 100.0])
+
+    if CUSTOM_EMAX:
+        emin, emax = get_emin_emax(time)
+    else:
+        if emax_percentile is not None:
+            entropy_max = pe[emax_percentile]
+        emax = entropy_max - 1.0
+        emin = emax - 3.0
+
+    if yt.is_root():
+        print("emin/emax:",emin,emax)
+        # check if emax > emin
+        if emax <= emin:
+            print("Error: emax <= emin")
+            quit()
+
+    brick_file = None
+    if cache_bricks:
+        brick_file = ('kd_bricks_'+header+'_'+str(cycle).zfill(4)+
+                      '_ghost'+str(int(use_ghost_zones))+'.npz')
+        if preview is not None and preview.max_level is not None:
+            brick_file = brick_file.replace('.npz','_level'+str(preview.max_level)+'.npz')
+    bounds = (entropy_min,entropy_max)
+    with timer.stage("scene"):
+        sc = create_vr_scene(ds,emin,emax,time,use_ghost_zones,brick_file,bounds,preview)
+
     # plot the transfer function
     #source.tfh.plot('fig_transfer_function_entr.png', profile_field='cell_mass')
 
     # plot volume rendering plot without annotation 
     if not annotate:
-        sc.save('fig_vr_'+header+'_'+string.zfill(cycle,4)+'.png', sigma_clip=4)
+        fname = 'fig_vr_'+header+'_'+str(cycle).zfill(4)+'.png'
+        text_string = ""
 
     else:
         # with annotation
@@ -183,60 +449,254 @@ def plot_a_vr(path,header,cycle,use_ghost_zones=True,annotate=True,rotate=False,
         #sc.annotate_domain(ds,color=[1,1,1,0.01])
         #text_string= "Time = %.1f (ms)" % (float(ds.current_time.to('s')*1.e3))
         text_string= "Time = %.1f (ms)" % (float(time*1.e3))
-        sc.save_annotated("fig_vr_"+header+"_annotated_"+string.zfill(cycle,4)+'.png',
-                sigma_clip=4.0,
-                label_fmt="%.1f",
-                text_annotate=[[(0.05,0.95), 
-                text_string,dict(color="w", fontsize="20", horizontalalignment="left")]])
+        fname = "fig_vr_"+header+"_annotated_"+str(cycle).zfill(4)+'.png'
+
+    if progressive:
+        # write a low resolution image first, then refine it
+        render_progressive(sc,fname,annotate,text_string,budget=budget,tolerance=tolerance)
+    else:
+        with timer.stage("render"):
+            save_image(sc,fname,annotate,text_string)
+
+    # under MPI, the scene of this rank is built once for the rotation and the zoom
+    rank_scene = []
+    def build_scene():
+        if len(rank_scene) == 0:
+            my_sc = create_vr_scene(ds,emin,emax,time,use_ghost_zones,brick_file,bounds,preview)
+            if annotate:
+                my_sc.annotate_axes(alpha=0.8)
+            rank_scene.append(my_sc)
+        return rank_scene[0]
 
     # rotate the camera
     if DO_ROT:
         rotate = True
 
     if rotate:
-        fstart = 1   # modify here for restart
         frames = ROT_FRAMES # total number of frames for rotation
-        cam = sc.camera
-        i=0
-        for _ in cam.iter_rotate(2.0*np.pi, frames):
-            i+=1
-            if i>= fstart:
-                sc.render()
-                if not annotate:
-                    sc.save("fig_vr_"+header+"_"+string.zfill(cycle,4)+'_rot_'+string.zfill(i,4)+'.png',
-                            sigma_clip=2)
-                else:
-                    sc.save_annotated("fig_vr_"+header+"_annotated_"+
-                        string.zfill(cycle,4)+'_rot_'+string.zfill(i,4)+'.png',
-                        sigma_clip=4.0,
-                        text_annotate=[[(0.05,0.95), 
-                        text_string,dict(color="w", fontsize="20", horizontalalignment="left")]])
+        poses  = get_frame_poses(sc.camera,"rot",frames)
+        fnames = [get_frame_name(header,cycle,annotate,"rot",i) for i in range(1,frames+1)]
+        with timer.stage("frames",kind="rot",nframes=frames):
+            render_frames(sc,poses,fnames,annotate,text_string,nprocs=nprocs,build_scene=build_scene)
 
     # TODO: zoom in or zoom out
     if DO_ZOOM:
         zoom = True
 
     if zoom:
-        fstart = 0 # modify here for restart
         frames = ZOOM_FRAMES
-        cam = sc.camera
-        i=0
-        for _ in cam.iter_zoom(ZOOM_FACT,ZOOM_FRAMES):
-            i+=1
-            if i>= fstart:
-                sc.render()
-                if not annotate:
-                    sc.save("fig_vr_"+header+"_"+string.zfill(cycle,4)+'_zoom_'+string.zfill(i,4)+'.png',
-                            sigma_clip=2)
-                else:
-                    sc.save_annotated("fig_vr_"+header+"_annotated_"+
-                        string.zfill(cycle,4)+'_zoom_'+string.zfill(i,4)+'.png',
-                        sigma_clip=4.0,
-                        text_annotate=[[(0.05,0.95), 
-                        text_string,dict(color="w", fontsize="20", horizontalalignment="left")]])
+        poses  = get_frame_poses(sc.camera,"zoom",frames)
+        fnames = [get_frame_name(header,cycle,annotate,"zoom",i) for i in range(1,frames+1)]
+        with timer.stage("frames",kind="zoom",nframes=frames):
+            render_frames(sc,poses,fnames,annotate,text_string,nprocs=nprocs,build_scene=build_scene)
+        save_trace(trace,preview,ds,perf_counter()-t_start)
         quit()
 
+    save_trace(trace,preview,ds,perf_counter()-t_start)
+    return
+
+def save_trace(trace,preview=None,ds=None,elapsed=None):
+    """
+    save the stage timings of the root process, if a trace file is given,
+    and report the savings of a preview
+    """
+    if not yt.is_root():
+        return
+    if preview is not None:
+        preview.report(ds,1.e8,elapsed)
+    if trace is not None:
+        timer.save(trace)
+    return
+
+def save_image(sc,fname,annotate,text_string,render=True):
+    """
+    save the image of the scene, with the transfer function and the text
+    if annotate. If render is False, the last rendered image is saved.
+    """
+    if not annotate:
+        sc.save(fname,sigma_clip=4,render=render)
+    else:
+        sc.save_annotated(fname,
+                sigma_clip=4.0,
+                label_fmt="%.1f",
+                render=render,
+                text_annotate=[[(0.05,0.95), 
+                text_string,dict(color="w", fontsize="20", horizontalalignment="left")]])
+    return
+
+def get_progressive_resolutions(resolution,npasses=4):
+    """
+    return the resolutions of the passes of a progressive rendering,
+    ex. (1024,1024) -> [(128,128), (256,256), (512,512), (1024,1024)]
+    """
+    resolutions = []
+    for i in range(npasses-1,-1,-1):
+        res = (max(resolution[0]//2**i,16),max(resolution[1]//2**i,16))
+        if res not in resolutions:
+            resolutions.append(res)
+    return resolutions
+
+def get_image_change(last,image):
+    """
+    return the mean change of the rgb pixels of image from the lower 
+    resolution image last (nearest neighbor upsampled), relative to the mean of image
+    """
+    last  = np.asarray(last)[:,:,:3]
+    image = np.asarray(image)[:,:,:3]
+    ix = np.arange(image.shape[0])*last.shape[0]//image.shape[0]
+    iy = np.arange(image.shape[1])*last.shape[1]//image.shape[1]
+    diff = np.abs(last[ix][:,iy]-image).mean()
+    return diff/max(np.abs(image).mean(),1.e-300)
+
+def render_progressive(sc,fname,annotate,text_string,npasses=4,budget=None,tolerance=None):
+    """
+    render the scene at increasing resolutions up to the camera resolution.
+    The scene, its bricks and transfer function are reused by all passes,
+    and the image is written to fname after each pass, so a preview 
+    is available after a small fraction of the full render time.
+
+    npasses [int]    : number of passes, each doubles the resolution
+    budget [float]   : stop before a pass that is predicted to end after
+                       budget seconds (the render cost scales with the number of pixels)
+    tolerance [float]: stop when the image changes less than this between two passes
+
+    return: the resolution of the written image
+    """
+    cam  = sc.camera
+    full = tuple(cam.resolution)
+    resolutions = get_progressive_resolutions(full,npasses)
+    t_start = perf_counter()
+    last = None
+    try:
+        for i, res in enumerate(resolutions):
+            cam.resolution = res
+            t_pass = perf_counter()
+            with timer.stage("render",resolution=res[0]):
+                image = sc.render()
+            t_render = perf_counter()-t_pass
+            # write to a temporary file first, so a viewer never reads a broken image
+            with timer.stage("save",fout=fname,resolution=res[0]):
+                tmp = fname[:-len('.png')]+'.tmp.png'
+                save_image(sc,tmp,annotate,text_string,render=False)
+                os.rename(tmp,fname)
+            if yt.is_root():
+                print("pass %d: %dx%d in %.1f s" % (i+1,res[0],res[1],perf_counter()-t_pass))
+            if i == len(resolutions)-1:
+                break
+            if tolerance is not None and last is not None:
+                if get_image_change(last,image) < tolerance:
+                    break
+            if budget is not None:
+                nxt = resolutions[i+1]
+                t_save = perf_counter()-t_pass-t_render
+                cost = t_render*(nxt[0]*nxt[1])/float(res[0]*res[1])+t_save
+                if perf_counter()-t_start+cost > budget:
+                    break
+            last = image
+    finally:
+        cam.resolution = full
+    return res
+
+def get_frame_name(header,cycle,annotate,kind,i):
+    """
+    return the file name of the i-th frame of a rotation/zoom (kind = "rot"/"zoom")
+    """
+    if not annotate:
+        return "fig_vr_"+header+"_"+str(cycle).zfill(4)+'_'+kind+'_'+str(i).zfill(4)+'.png'
+    return ("fig_vr_"+header+"_annotated_"+
+            str(cycle).zfill(4)+'_'+kind+'_'+str(i).zfill(4)+'.png')
+
+def get_camera_pose(cam):
+    return (cam.position.copy(), cam.focus.copy(), cam.width.copy(),
+            cam.normal_vector.copy(), cam.north_vector.copy())
+
+def set_camera_pose(cam,pose):
+    position, focus, width, normal_vector, north_vector = pose
+    cam.position = position
+    cam.focus    = focus
+    cam.width    = width
+    cam.switch_view(normal_vector=normal_vector,north_vector=north_vector)
+    return
+
+def get_frame_poses(cam,kind,frames):
+    """
+    compute all camera poses of a rotation (kind="rot") or a zoom (kind="zoom")
+    without rendering. The camera is restored afterwards.
+
+    return: a list of camera poses, one for each frame
+    """
+    start = get_camera_pose(cam)
+    if kind == "rot":
+        steps = cam.iter_rotate(2.0*np.pi, frames)
+    else:
+        steps = cam.iter_zoom(ZOOM_FACT, frames)
+    poses = [get_camera_pose(cam) for _ in steps]
+    set_camera_pose(cam,start)
+    return poses
+
+def render_a_frame(sc,pose,fname,annotate,text_string):
+    set_camera_pose(sc.camera,pose)
+    with timer.stage("render",fout=fname):
+        sc.render()
+    # save the image rendered above, without rendering it again
+    with timer.stage("save",fout=fname):
+        if not annotate:
+            sc.save(fname,sigma_clip=2,render=False)
+        else:
+            sc.save_annotated(fname,
+                sigma_clip=4.0,
+                render=False,
+                text_annotate=[[(0.05,0.95), 
+                text_string,dict(color="w", fontsize="20", horizontalalignment="left")]])
+    return
 
+# the job shared with the forked workers of render_frames
+_frame_job = None
+
+def _render_a_frame(i):
+    """
+    render frame i in a forked worker, return its timings
+    """
+    sc, poses, fnames, annotate, text_string = _frame_job
+    # drop the timings inherited from the parent
+    timer.take()
+    render_a_frame(sc,poses[i],fnames[i],annotate,text_string)
+    return timer.take()
+
+def render_frames(sc,poses,fnames,annotate,text_string,nprocs=1,build_scene=None):
+    """
+    render the frames that are not on disk yet, so an interrupted run
+    restarts where it stopped.
+
+    Under MPI, each rank gets its own scene from build_scene() (built
+    once per rank) and renders a contiguous range of frames. Otherwise the frames are
+    rendered by nprocs forked processes that share the scene sc.
+    """
+    todo = [i for i in range(len(poses)) if not os.path.exists(fnames[i])]
+    if len(todo) == 0:
+        return
+    if yt.is_root():
+        print("render",len(todo),"of",len(poses),"frames")
+
+    comm = yt.communication_system.communicators[-1]
+    if comm.size > 1 and build_scene is not None:
+        ranges = [r for r in np.array_split(todo,comm.size) if len(r) > 0]
+        for frames in yt.parallel_objects(ranges,njobs=len(ranges)):
+            my_sc = build_scene()
+            for i in frames:
+                render_a_frame(my_sc,poses[i],fnames[i],annotate,text_string)
+    elif nprocs > 1:
+        global _frame_job
+        _frame_job = (sc,poses,fnames,annotate,text_string)
+        pool = Pool(nprocs)
+        for records, fields in pool.map(_render_a_frame,todo,chunksize=1):
+            timer.merge(records,fields)
+        pool.close()
+        pool.join()
+        _frame_job = None
+    else:
+        for i in todo:
+            render_a_frame(sc,poses[i],fnames[i],annotate,text_string)
     return
 
 
@@ -0,0 +1,302 @@
+import os, sys
+import json
+import time
+from optparse import OptionParser
+import matplotlib as mpl
+mpl.use('Agg')
+import matplotlib.pyplot as plt
+import add_fields as af
+import slice2d
+from dataset_cache import datasets
+from get_profiles import RadialProfile, AngularProfile
+from column_store import ColumnStore
+from time_series import get_file_list
+from utility.timer import timer
+"""
+Watch the output directory of a running simulation and process
+the new checkpoints as they are written.
+
+A manifest of the processed files (path, size, mtime) is kept in the
+output directory, so a restarted watcher only processes the new or
+changed files. A file is processed once its size and mtime have not
+changed for one poll and it is older than --settle seconds, so
+files that are still being written are skipped. With --once, the
+files are checked twice one second apart instead.
+
+The stages (-s) are
+
+    profiles: radial profiles, appended to <outdir>/profiles (a ColumnStore)
+    slices:   png slices <outdir>/slices/<file>_<var>.png, and the images
+              in <outdir>/images (a ColumnStore)
+    shock:    the mean/min/max shock radius, appended to <outdir>/shock_radius.txt
+
+ex.
+    python watch.py -i "output/ccsn2d_hdf5_plt_cnt_*" -o analysis -s profiles,shock
+
+"""
+
+STAGES = ["profiles","slices","shock"]
+
+class Watcher():
+    """
+    process the new files of a glob pattern or directory
+
+    pattern [str]:   directory or glob pattern of the files
+    outdir  [str]:   output directory
+    stages  [str]:   the stages to run on each file
+    settle  [float]: min age of a file in seconds before it is processed
+    """
+    def __init__(self,pattern,outdir,stages=("profiles",),variables=("dens","entr","ye  "),
+                 dr=1.e5,rmax=5.e7,settle=30.0,ntheta=32,nphi=1,
+                 shock_var="entr",shock_threshold=None):
+        for stage in stages:
+            if stage not in STAGES:
+                raise ValueError("Unknown stage: "+str(stage))
+        self.pattern   = pattern
+        self.outdir    = outdir
+        self.stages    = list(stages)
+        self.variables = list(variables)
+        self.dr        = dr
+        self.rmax      = rmax
+        self.settle    = settle
+        self.ntheta    = ntheta
+        self.nphi      = nphi
+        self.shock_var = shock_var
+        self.shock_threshold = shock_threshold
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+        self.manifest_file = os.path.join(outdir,"manifest.json")
+        self.manifest = {}
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file) as f:
+                self.manifest = json.load(f)
+        # the stats of the last poll, to detect the files being written
+        self.last_stats = {}
+        return
+
+    def save_manifest(self):
+        # write to a temporary file first, so an interrupted run leaves a valid manifest
+        with open(self.manifest_file+".tmp","w") as f:
+            json.dump(self.manifest,f,indent=1)
+        os.rename(self.manifest_file+".tmp",self.manifest_file)
+        return
+
+    def get_new_files(self):
+        """
+        return the files that are new or changed since they were
+        processed, and are fully written
+        """
+        now   = time.time()
+        files = []
+        stats = {}
+        for fn in get_file_list(self.pattern):
+            key = os.path.abspath(fn)
+            try:
+                st = os.stat(fn)
+            except OSError:
+                continue
+            stats[key] = [st.st_size,st.st_mtime]
+            done = self.manifest.get(key)
+            # the failed files are retried
+            if done is not None and not done.get("failed") and \
+               [done["size"],done["mtime"]] == stats[key]:
+                continue
+            # still being written
+            if self.last_stats.get(key) != stats[key] and self.settle > 0:
+                continue
+            if now-st.st_mtime < self.settle:
+                continue
+            files.append(fn)
+        self.last_stats = stats
+        return files
+
+    def process(self,fn):
+        """
+        run all stages on one file and record it in the manifest
+        """
+        key = os.path.abspath(fn)
+        st  = os.stat(fn)
+        entry = {"size":st.st_size,"mtime":st.st_mtime,"stages":[],"failed":False}
+        try:
+            ds  = datasets.get(fn)
+            dim = af.get_dimension(ds)
+            t   = float(ds.current_time.in_cgs().v)
+            for stage in self.stages:
+                with timer.stage(stage,fn=fn):
+                    getattr(self,"run_"+stage)(fn,ds,dim,t)
+                entry["stages"].append(stage)
+        except Exception as e:
+            print("Error: failed to process",fn,e)
+            entry["failed"] = True
+        finally:
+            # keep only one file in memory
+            datasets.clear()
+            af.clear_geometry_cache()
+            # the timings are not kept, so they do not grow with the files
+            timer.reset()
+        self.manifest[key] = entry
+        self.save_manifest()
+        return not entry["failed"]
+
+    def run_profiles(self,fn,ds,dim,t):
+        rp = RadialProfile(dr=self.dr,rmax=self.rmax)
+        rp.get_profile(ds,dim,self.variables)
+        store = ColumnStore(os.path.join(self.outdir,"profiles"))
+        store.append_profile(os.path.abspath(fn),t,rp.radius,
+                {var:rp.profiles[var] for var in self.variables})
+        return
+
+    def run_slices(self,fn,ds,dim,t):
+        if dim == 1:
+            return
+        if dim == 2:
+            images = slice2d.get_slice_images(ds,self.variables,self.rmax)
+        else:
+            images = slice2d.get_slice_images(ds,self.variables,self.rmax,axis='z',coord=0.0)
+        slcdir = os.path.join(self.outdir,"slices")
+        if not os.path.isdir(slcdir):
+            os.makedirs(slcdir)
+        store   = ColumnStore(os.path.join(self.outdir,"images"))
+        entries = {}
+        extent  = [-self.rmax,self.rmax,-self.rmax,self.rmax]
+        for var in self.variables:
+            name = os.path.basename(fn)+'_'+var.strip()
+            entries[name] = store.write_image(name,images[var],save_index=False,
+                    var=var,fn=os.path.abspath(fn),time=t,extent=extent)
+            fig = plt.figure(1,figsize=(7,10))
+            plt.clf()
+            slice2d.draw_image(images[var],var,self.rmax)
+            plt.title("Time = %.1f (ms)" % (t*1.e3))
+            fig.savefig(os.path.join(slcdir,name+'.png'))
+            plt.close(fig)
+        store.add_images(entries)
+        return
+
+    def run_shock(self,fn,ds,dim,t):
+        if dim == 1:
+            return
+        nphi = 1
+        if dim == 3:
+            nphi = self.nphi
+        ap = AngularProfile(dr=self.dr,rmax=self.rmax,ntheta=self.ntheta,nphi=nphi)
+        ap.get_profile(ds,dim,[self.shock_var])
+        radii, stats = ap.get_shock_radius(self.shock_var,self.shock_threshold)
+        fout = os.path.join(self.outdir,"shock_radius.txt")
+        lines = ["# time [s], mean, min, max shock radius [cm], file\n"]
+        if os.path.exists(fout):
+            with open(fout) as f:
+                lines = f.readlines()
+        # a reprocessed file replaces its row
+        path  = os.path.abspath(fn)
+        lines = [line for line in lines
+                 if line.startswith("#") or line.split(None,4)[-1].rstrip("\n") != path]
+        lines.append("%.8e %.8e %.8e %.8e %s\n" % (t,stats["mean"],stats["min"],stats["max"],path))
+        with open(fout+".tmp","w") as f:
+            f.writelines(lines)
+        os.rename(fout+".tmp",fout)
+        return
+
+    def poll(self):
+        """
+        process the new files once
+
+        return: number of processed files
+        """
+        n = 0
+        for fn in self.get_new_files():
+            if self.process(fn):
+                print("Processed",fn)
+            n += 1
+        return n
+
+    def poll_once(self,wait=1.0):
+        """
+        process the new files once, without a previous poll.
+        The files are checked twice, wait seconds apart, so the files 
+        still being written are skipped as in watch.
+
+        return: number of processed files
+        """
+        self.get_new_files()
+        time.sleep(wait)
+        return self.poll()
+
+    def watch(self,interval=60.0):
+        """
+        poll the files every interval seconds, until interrupted
+        """
+        try:
+            while True:
+                self.poll()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        return
+
+def default(str):
+    return str + ' [Default: %default]'
+def readCommand(argv):
+    usageStr = """
+
+    USAGE: python watch.py -i <directory or glob> -o <output directory> <options>
+
+    EXAMPLE: python watch.py -i "output/ccsn2d_hdf5_plt_cnt_*" -o analysis -s profiles,slices,shock
+
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-i','--input',dest="input",
+            help=default('Data directory or glob pattern'),default='.')
+    parser.add_option('-o','--outdir',dest="outdir",
+            help=default('Output directory'),default='analysis')
+    parser.add_option('-s','--stages',dest="stages",
+            help=default('Comma separated stages ('+','.join(STAGES)+')'),default='profiles')
+    parser.add_option('-v','--var',dest="var",
+            help=default('Comma separated variables of the profiles and slices'),default='dens,entr,ye  ')
+    parser.add_option('--dr',dest="dr",
+            help=default('Radial bin size'),default=1.e5)
+    parser.add_option('-r','--rmax',dest="rmax",
+            help=default('Max radius'),default=5.e7)
+    parser.add_option('--interval',dest="interval",
+            help=default('Seconds between polls'),default=60.)
+    parser.add_option('--settle',dest="settle",
+            help=default('Min age of a file in seconds before it is processed'),default=30.)
+    parser.add_option('--once',dest="once",action="store_true",
+            help=default('Process the files once and exit'),default=False)
+    parser.add_option('--ntheta',dest="ntheta",
+            help=default('Number of theta bins of the shock radius'),default=32)
+    parser.add_option('--nphi',dest="nphi",
+            help=default('Number of phi bins of the shock radius (3D)'),default=16)
+    parser.add_option('--shock-var',dest="shock_var",
+            help=default('Variable to find the shock'),default='entr')
+    parser.add_option('--shock-threshold',dest="shock_threshold",
+            help=default('Shock at the outermost bin with the variable above this value, '
+                         'instead of the steepest drop'),default='')
+
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understand: '+str(otherjunk))
+
+    return options
+
+if __name__=='__main__':
+
+    options = readCommand(sys.argv[1:])
+    threshold = None
+    if options.shock_threshold != '':
+        threshold = float(options.shock_threshold)
+
+    watcher = Watcher(options.input,options.outdir,
+            stages=options.stages.split(','),
+            variables=options.var.split(','),
+            dr=float(options.dr),
+            rmax=float(options.rmax),
+            settle=float(options.settle),
+            ntheta=int(options.ntheta),
+            nphi=int(options.nphi),
+            shock_var=options.shock_var,
+            shock_threshold=threshold)
+    if options.once:
+        watcher.poll_once()
+    else:
+        watcher.watch(float(options.interval))
+    print("Done.")
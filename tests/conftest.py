@@ -0,0 +1,33 @@
+import os, sys
+import pytest
+"""
+The tests run on the small synthetic FLASH-like datasets of benchmark.py,
+so no data files are needed.
+
+    python -m pytest -q tests
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,os.path.join(ROOT,"scripts"))
+sys.path.insert(0,os.path.join(ROOT,"bin"))
+
+import matplotlib as mpl
+mpl.use('Agg')
+
+def make_dataset(dim,n):
+    import benchmark
+    from dataset_cache import setup_dataset, add_default_fields
+    ds = benchmark.create_dataset(dim,n)
+    return setup_dataset(ds,[add_default_fields])
+
+@pytest.fixture(scope="module")
+def ds1d():
+    return make_dataset(1,200)
+
+@pytest.fixture(scope="module")
+def ds2d():
+    return make_dataset(2,32)
+
+@pytest.fixture(scope="module")
+def ds3d():
+    return make_dataset(3,16)
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from column_store import ColumnStore
+
+def test_append_and_replace_profiles(tmp_path):
+    store = ColumnStore(str(tmp_path/"profiles.store"))
+    radius = np.arange(1.,5.)
+    store.append_profile("chk_0000",0.0,radius,{"dens":radius*1.0,"entr":radius*2.0})
+    store.append_profile("chk_0001",0.1,radius,{"dens":radius*3.0,"entr":radius*4.0})
+    store.append_profile("chk_0000",0.05,radius,{"dens":radius*5.0,"entr":radius*6.0})
+
+    store = ColumnStore(str(tmp_path/"profiles.store"))
+    assert store.get_files() == ["chk_0000","chk_0001"]
+    np.testing.assert_array_equal(store.get_time(),[0.05,0.1])
+    np.testing.assert_array_equal(store.get_profiles("dens"),[radius*5.0,radius*3.0])
+    np.testing.assert_array_equal(store.get_profiles("entr"),[radius*6.0,radius*4.0])
+
+@pytest.mark.parametrize("fn",["chk_0000","chk_0001"])
+def test_reject_other_variables(tmp_path,fn):
+    store = ColumnStore(str(tmp_path/"profiles.store"))
+    radius = np.arange(1.,5.)
+    store.append_profile("chk_0000",0.0,radius,{"dens":radius})
+    with pytest.raises(ValueError,match="variables"):
+        store.append_profile(fn,0.1,radius,{"dens":radius,"entr":radius})
+    with pytest.raises(ValueError,match="variables"):
+        store.append_profile(fn,0.1,radius,{"entr":radius})
+    with pytest.raises(ValueError,match="radius"):
+        store.append_profile(fn,0.1,radius[:2],{"dens":radius[:2]})
+    assert store.get_variables() == ["dens"]
+    assert store.get_files() == ["chk_0000"]
+    np.testing.assert_array_equal(store.get_time(),[0.0])
@@ -0,0 +1,22 @@
+import movie2d
+from utility.timer import timer
+
+@timer.field
+def _fake_field(field,data):
+    return data
+
+def fake_load_images(fn,fields,rmax):
+    with timer.stage("load",fn=fn):
+        _fake_field(None,1.0)
+    return fn, 0.0, {}
+
+def test_prefetch_merges_the_worker_timings(monkeypatch):
+    monkeypatch.setattr(movie2d,"load_images",fake_load_images)
+    timer.reset()
+    args = [("chk_%04d" % i,["dens"],1.e7) for i in range(3)]
+    results = list(movie2d.prefetch(args,nprocs=2))
+    assert [fn for fn, time, images in results] == [arg[0] for arg in args]
+    trace = timer.get_trace()
+    assert [r["stage"] for r in trace].count("load") == 3
+    assert timer.fields["_fake_field"]["calls"] == 3
+    timer.reset()
@@ -0,0 +1,28 @@
+import numpy as np
+from profile_cache import ProfileCache
+from get_profiles import RadialProfile
+from preview import Preview
+
+def test_preview_profiles_have_their_own_key(tmp_path,monkeypatch,ds3d):
+    # the cache keys need a file on disk
+    fn = tmp_path/"ccsn3d_hdf5_chk_0000"
+    fn.write_bytes(b"0")
+    monkeypatch.setattr(type(ds3d),"parameter_filename",str(fn))
+    cache = ProfileCache(str(tmp_path/"cache"))
+
+    rp = RadialProfile(dr=1.e6,rmax=2.4e7,cache=cache,preview=Preview(max_level=0))
+    rp.get_profile(ds3d,3,["dens"])
+    preview = rp.profiles["dens"]
+
+    rp = RadialProfile(dr=1.e6,rmax=2.4e7,cache=cache)
+    rp.get_profile(ds3d,3,["dens"])
+    full = RadialProfile(dr=1.e6,rmax=2.4e7)
+    full.get_profile(ds3d,3,["dens"])
+    assert not np.array_equal(preview,full.profiles["dens"])
+    np.testing.assert_array_equal(rp.profiles["dens"],full.profiles["dens"])
+
+    # both are reused
+    rp = RadialProfile(dr=1.e6,rmax=2.4e7,cache=cache,preview=Preview(max_level=0))
+    key = cache.get_key(str(fn),3,rp.dr,rp.rmax,"cell_mass","dens",rp.preview)
+    np.testing.assert_array_equal(cache.get(key),preview)
+    assert key != cache.get_key(str(fn),3,rp.dr,rp.rmax,"cell_mass","dens")
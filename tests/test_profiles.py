@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+import yt
+from get_profiles import RadialProfile, AngularProfile
+
+# dim: (dr, rmax), the bins are narrower than the cells, so some are empty,
+# and the last bin at rmax has cells
+BINS = {1:(1.e5,1.99e7), 2:(4.e5,2.e7), 3:(1.e6,2.4e7)}
+
+def get_dataset(request,dim):
+    return request.getfixturevalue("ds%dd" % dim)
+
+def yt_profile(rp,ds,dim,variables,weight,accumulation=False):
+    """
+    the yt.create_profile with the bins of rp
+    """
+    rfield = rp.radius_fields[dim]
+    return yt.create_profile(rp.get_sphere(ds),rfield,variables,
+            n_bins=rp.nbins,
+            extrema={rfield:(rp.dr/2,rp.rmax+rp.dr/2)},
+            logs={rfield:False},
+            weight_field=weight,
+            accumulation=accumulation)
+
+@pytest.mark.parametrize("dim",[1,2,3])
+def test_chunked_profile_matches_yt(request,dim):
+    ds = get_dataset(request,dim)
+    dr, rmax = BINS[dim]
+    rp = RadialProfile(dr=dr,rmax=rmax,engine="bincount")
+    variables = ["dens","entr"]
+    rp.get_chunked_profile(ds,dim,variables)
+
+    # 1d profiles are cell averages
+    weight = rp.weight_fields[dim] or ("index","ones")
+    ref = yt_profile(rp,ds,dim,variables,weight)
+    assert (~ref.used).any()
+    assert ref.used[-1]
+    for var in variables:
+        assert rp.profiles[var].shape == (rp.nbins,)
+        np.testing.assert_allclose(rp.profiles[var],ref[var].d,rtol=1e-12)
+        assert np.all(rp.profiles[var][~ref.used] == 0.0)
+
+def test_bin_index_edges():
+    rp = RadialProfile(dr=1.e5,rmax=1.e6)
+    r = np.array([0.0,0.5e5,1.e5,1.49e5,1.51e5,1.e6,1.05e6,1.06e6])
+    assert list(rp.get_bin_index(r)) == [-1,0,0,0,1,9,-1,-1]
+
+def cells_by_bin(rp,ds,dim,var):
+    """
+    the bin index and the values of the cells in the sphere
+    """
+    source = rp.get_sphere(ds)
+    idx = rp.get_bin_index(source[rp.radius_fields[dim]].in_cgs().d)
+    use = idx >= 0
+    return idx[use], source[var].d[use]
+
+@pytest.mark.parametrize("dim",[1,2,3])
+def test_multi_profile_matches_yt(request,dim):
+    ds = get_dataset(request,dim)
+    dr, rmax = BINS[dim]
+    rp = RadialProfile(dr=dr,rmax=rmax)
+    variables = ["dens","entr"]
+    mass = {1:"sph_cell_mass",2:"cyl_cell_mass",3:"cell_mass"}[dim]
+    weights = [mass,None]
+    profile = rp.get_multi_profile(ds,dim,variables,weights,RadialProfile.statistics)
+
+    for w in weights:
+        ref = yt_profile(rp,ds,dim,variables,w or ("index","ones"))
+        assert (~ref.used).any()
+        assert ref.used[-1]
+        for var in variables:
+            np.testing.assert_allclose(profile.get(var,"mean",w),ref[var].d,rtol=1e-12)
+            std = ref.standard_deviation[ref.field_map[var]].d
+            np.testing.assert_allclose(profile.get(var,"variance",w),std**2,
+                                       rtol=1e-8,atol=1e-12*ref[var].d.max()**2)
+            assert np.all(profile.get(var,"variance",w)[~ref.used] == 0.0)
+
+    ref = yt_profile(rp,ds,dim,variables,None)
+    acc = yt_profile(rp,ds,dim,variables,None,accumulation=True)
+    for var in variables:
+        np.testing.assert_allclose(profile.get(var,"sum"),ref[var].d,rtol=1e-12)
+        np.testing.assert_allclose(profile.get(var,"accumulation"),acc[var].d,rtol=1e-12)
+
+        idx, v = cells_by_bin(rp,ds,dim,var)
+        for stat, func in (("min",np.min),("max",np.max)):
+            expected = np.full(rp.nbins,np.nan)
+            for i in np.unique(idx):
+                expected[i] = func(v[idx == i])
+            np.testing.assert_array_equal(profile.get(var,stat),expected)
+            assert np.all(np.isnan(profile.get(var,stat)[~ref.used]))
+
+def test_variance_of_a_large_mean(ds3d):
+    # a small spread on top of a large mean, where <v^2>-<v>^2 cancels
+    ds = ds3d
+    def _offset_entr(field,data):
+        return 1.e6+data["entr"]
+    ds.add_field(("gas","offset_entr"),function=_offset_entr,sampling_type="cell",
+                 units="",force_override=True)
+    dr, rmax = BINS[3]
+    rp = RadialProfile(dr=dr,rmax=rmax)
+    profile = rp.get_multi_profile(ds,3,["entr","offset_entr"],["cell_mass"],["variance"])
+    variance = profile.get("entr","variance","cell_mass")
+    assert variance.max() > 0.0
+    np.testing.assert_allclose(profile.get("offset_entr","variance","cell_mass"),variance,
+                               rtol=1e-6,atol=1e-6*variance.max())
+
+def test_angular_profile_of_2d_data(ds2d):
+    ap = AngularProfile(dr=4.e5,rmax=2.e7,ntheta=4,nphi=4)
+    with pytest.raises(ValueError):
+        ap.get_profile(ds2d,2,["entr"])
+
+    ap = AngularProfile(dr=4.e5,rmax=2.e7,ntheta=4,nphi=1)
+    ap.get_profile(ds2d,2,["entr"])
+    assert ap.profiles["entr"].shape == (4,1,ap.nbins)
+    radii, stats = ap.get_shock_radius("entr",threshold=5.0)
+    assert np.all(np.isfinite(radii))
+    assert stats["min"] <= stats["mean"] <= stats["max"]
+
+def test_profile_default_weight(ds3d):
+    dr, rmax = BINS[3]
+    rp = RadialProfile(dr=dr,rmax=rmax)
+    profile = rp.get_profile(ds3d,3,["dens"],stats=["mean","variance"])
+    np.testing.assert_array_equal(profile.get("dens"),profile.get("dens","mean","cell_mass"))
+    np.testing.assert_array_equal(profile.get("dens","variance"),
+                                  profile.get("dens","variance","cell_mass"))
+    np.testing.assert_array_equal(profile.get("dens"),rp.profiles["dens"])
+
+    profile = rp.get_profile(ds3d,3,["dens"],weights=[None,"cell_mass"])
+    assert profile.get("dens") is profile.get("dens","mean","cell_mass")
+    profile = rp.get_profile(ds3d,3,["dens"],weights=[None])
+    assert profile.get("dens") is profile.get("dens","mean",None)
@@ -0,0 +1,27 @@
+from multiprocessing import Pool
+from utility.timer import Timer, timer
+
+def _work(i):
+    timer.take()
+    with timer.stage("work",i=i):
+        pass
+    return timer.take()
+
+def test_merge_worker_records():
+    timer.reset()
+    with timer.stage("parent"):
+        pass
+    pool = Pool(2)
+    for records, fields in pool.map(_work,range(3)):
+        timer.merge(records,fields)
+    pool.close()
+    pool.join()
+    stages = [record["stage"] for record in timer.get_trace()]
+    assert stages.count("parent") == 1
+    assert stages.count("work") == 3
+
+def test_merge_field_timings():
+    t = Timer()
+    t.merge([],{"_entr":{"calls":2,"wall":1.0,"cpu":0.5}})
+    t.merge([],{"_entr":{"calls":1,"wall":0.5,"cpu":0.5}})
+    assert t.fields["_entr"] == {"calls":3,"wall":1.5,"cpu":1.0}
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+import benchmark
+
+@pytest.fixture(scope="module")
+def vr():
+    return benchmark.load_volume_rendering()
+
+def render(vr,ds,brick_file=None,bounds=(3.0,8.0)):
+    sc = vr.create_vr_scene(ds,4.0,7.0,0.0,use_ghost_zones=False,
+                            brick_file=brick_file,bounds=bounds)
+    sc.camera.resolution = (64,64)
+    return np.array(sc.render())
+
+def test_loaded_bricks_render_the_same(vr,ds3d,tmp_path,capsys):
+    vr.setup_dataset(ds3d,[vr.add_vr_fields])
+    vr.release_bricks()
+    fresh = render(vr,ds3d)
+
+    brick_file = str(tmp_path/"bricks.npz")
+    vr.release_bricks()
+    render(vr,ds3d,brick_file)
+    vr.release_bricks()
+    loaded = render(vr,ds3d,brick_file)
+
+    # the bricks were loaded, not rebuilt
+    assert "rebuild" not in capsys.readouterr().out
+    assert loaded.max() > 0
+    np.testing.assert_array_equal(fresh,loaded)
+
+def test_stale_brick_file_is_rebuilt(vr,ds3d,tmp_path,capsys):
+    vr.setup_dataset(ds3d,[vr.add_vr_fields])
+    brick_file = str(tmp_path/"bricks.npz")
+    vr.release_bricks()
+    sphere = ds3d.sphere([0,0,0],(1.e8,'cm'))
+    vr.get_volume(sphere,('gas','Entropy'),False,False,brick_file)
+
+    # another region gives another tree
+    vr.release_bricks()
+    sphere = ds3d.sphere([0,0,0],(3.e7,'cm'))
+    volume = vr.get_volume(sphere,('gas','Entropy'),False,False,brick_file)
+    assert "rebuild" in capsys.readouterr().out
+    info = np.load(brick_file)["info"]
+    assert '"radius": 30000000.0' in str(info)
+    assert len(volume.bricks) > 0
+
+def test_brick_cache_is_bounded(vr,ds3d):
+    vr.setup_dataset(ds3d,[vr.add_vr_fields])
+    vr.release_bricks()
+    for i in range(vr.BRICK_CACHE_SIZE+2):
+        sphere = ds3d.sphere([0,0,0],((2.+i)*1.e7,'cm'))
+        vr.get_volume(sphere,('gas','Entropy'),False,False)
+    assert len(vr._brick_cache) == vr.BRICK_CACHE_SIZE
+    vr.release_bricks(ds3d)
+    assert len(vr._brick_cache) == 0
+
+@pytest.mark.parametrize("content",[b"not a brick file",b"PK\x03\x04 truncated"])
+def test_corrupt_brick_file_is_rebuilt(vr,ds3d,tmp_path,capsys,content):
+    vr.setup_dataset(ds3d,[vr.add_vr_fields])
+    brick_file = tmp_path/"bricks.npz"
+    brick_file.write_bytes(content)
+    vr.release_bricks()
+    sphere = ds3d.sphere([0,0,0],(3.e7,'cm'))
+    volume = vr.get_volume(sphere,('gas','Entropy'),False,False,str(brick_file))
+    assert "cannot read" in capsys.readouterr().out
+    assert len(volume.bricks) > 0
+
+    # the rebuilt bricks replace the corrupt file
+    vr.release_bricks()
+    vr.get_volume(sphere,('gas','Entropy'),False,False,str(brick_file))
+    assert "rebuild" not in capsys.readouterr().out
+
+def test_field_range_outside_the_bounds(vr,ds3d,capsys):
+    vr.setup_dataset(ds3d,[vr.add_vr_fields])
+    sphere = ds3d.sphere([0,0,0],(3.e7,'cm'))
+    vmin, vmax, pe = vr.get_field_range(sphere,'Entropy',percentiles=[50.0,100.0])
+    assert "Warning" not in capsys.readouterr().out
+    assert vmin < pe[50.0] < vmax
+    assert pe[100.0] == vmax
+
+    # the median is above the bounds
+    vmin, vmax, pe = vr.get_field_range(sphere,'Entropy',bounds=(0.0,vmin),percentiles=[50.0,100.0])
+    assert "Warning" in capsys.readouterr().out
+    assert pe[50.0] == vmax
+    assert pe[100.0] == vmax
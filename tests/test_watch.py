@@ -0,0 +1,53 @@
+import os, time
+from watch import Watcher
+
+def write_file(fn,size,age):
+    with open(fn,"wb") as f:
+        f.write(b"0"*size)
+    t = time.time()-age
+    os.utime(fn,(t,t))
+    return fn
+
+def get_processed(watcher):
+    processed = []
+    watcher.process = lambda fn: processed.append(os.path.basename(fn)) or True
+    return processed
+
+def test_poll_once_skips_young_and_growing_files(tmp_path,monkeypatch):
+    old   = write_file(str(tmp_path/"chk_0000"),10,60.0)
+    young = write_file(str(tmp_path/"chk_0001"),10,1.0)
+    grows = write_file(str(tmp_path/"chk_0002"),10,60.0)
+    watcher = Watcher(str(tmp_path/"chk_*"),str(tmp_path/"out"),settle=30.0)
+    processed = get_processed(watcher)
+
+    # the file grows between the two checks
+    monkeypatch.setattr(time,"sleep",lambda wait: write_file(grows,20,60.0))
+    assert watcher.poll_once() == 1
+    assert processed == ["chk_0000"]
+
+def test_poll_waits_for_a_second_check(tmp_path):
+    write_file(str(tmp_path/"chk_0000"),10,60.0)
+    watcher = Watcher(str(tmp_path/"chk_*"),str(tmp_path/"out"),settle=30.0)
+    processed = get_processed(watcher)
+    assert watcher.poll() == 0
+    assert watcher.poll() == 1
+    assert processed == ["chk_0000"]
+
+def test_failed_files_are_retried(tmp_path):
+    write_file(str(tmp_path/"chk_0000"),10,60.0)
+    watcher = Watcher(str(tmp_path/"chk_*"),str(tmp_path/"out"),settle=0.0)
+    # not a dataset, so the processing fails
+    assert watcher.poll() == 1
+    assert list(watcher.manifest.values())[0]["failed"]
+    assert watcher.get_new_files() == [str(tmp_path/"chk_0000")]
+
+def test_reprocessed_shock_radius_replaces_its_row(tmp_path,ds2d):
+    watcher = Watcher(str(tmp_path/"chk_*"),str(tmp_path/"out"),rmax=2.e7,dr=4.e5,ntheta=4)
+    for fn, t in (("chk_0000",0.1),("chk_0001",0.2),("chk_0000",0.3)):
+        watcher.run_shock(str(tmp_path/fn),ds2d,2,t)
+    with open(str(tmp_path/"out"/"shock_radius.txt")) as f:
+        lines = f.readlines()
+    assert len(lines) == 3 and lines[0].startswith("#")
+    assert lines[1].split()[-1] == str(tmp_path/"chk_0001")
+    assert lines[2].split()[-1] == str(tmp_path/"chk_0000")
+    assert float(lines[2].split()[0]) == 0.3
@@ -0,0 +1,12 @@
+import matplotlib.pyplot as plt
+import benchmark
+
+def test_save_in_the_format_of_the_output(tmp_path):
+    yt_slice = benchmark.load_yt_slice()
+    for name, magic in (("slice.pdf",b"%PDF"),("slice.png",b"\x89PNG"),("slice",b"\x89PNG")):
+        fout = str(tmp_path/name)
+        plt.figure()
+        plt.plot([0,1],[0,1])
+        yt_slice.show_or_save(fout)
+        with open(fout,"rb") as f:
+            assert f.read(4) == magic